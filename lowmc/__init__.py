@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
-from pkg_resources import get_distribution, DistributionNotFound
 
-try:
-    # Change here if project is renamed and does not equal the package name
-    dist_name = 'Python-LowMC'
-    __version__ = get_distribution(dist_name).version
-except DistributionNotFound:
-    __version__ = 'unknown'
-finally:
-    del get_distribution, DistributionNotFound
+
+def __getattr__(name):
+    # The version is looked up on first access, importlib.metadata takes
+    # longer to import than the rest of the package
+    if name != '__version__':
+        raise AttributeError('module {!r} has no attribute {!r}'
+                             .format(__name__, name))
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        # Change here if project is renamed and does not equal the package name
+        dist_name = 'Python-LowMC'
+        value = version(dist_name)
+    except PackageNotFoundError:
+        value = 'unknown'
+    globals()['__version__'] = value
+    return value
@@ -0,0 +1,215 @@
+"""asyncio front-end for the LowMC blockcipher."""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+import os
+from typing import Optional, Union
+
+from lowmc import LowMC
+
+__author__ = "Thorsten Knoll"
+__copyright__ = "Thorsten Knoll"
+__license__ = "mit"
+
+# LowMC objects of a worker process of a process executor, by parameter
+# set, backend and key, in least recently used order
+_process_objects = OrderedDict()
+_process_objects_maxsize = 16
+
+
+class AsyncLowMC(object):
+    """Awaitable en- and decryption with a LowMC object.
+
+    The work is run on a thread or process executor, so the event loop is
+    not blocked. At most max_concurrency calls run on the executor at the
+    same time, further calls wait for a free slot (backpressure). Batches
+    are split into chunks of chunk_blocks blocks, which are sliced and
+    submitted one by one as slots free up, so a large batch neither floods
+    the executor nor the event loop. A batch given as a buffer is read
+    chunk by chunk and must not change until the call returns. Cancelling
+    a call cancels its chunks that have not started yet, a running chunk
+    is finished and keeps its slot until then.
+
+    With a process executor, every worker process sets up its own LowMC
+    object for the parameter set, backend and key of the call, which is
+    cached for the following calls.
+    """
+
+    __slots__ = ['__lowmc', '__executor', '__own_executor', '__processes',
+                 '__semaphore', '__chunk_blocks', '__running']
+
+    def __init__(self, lowmc: LowMC,
+                 executor: Union[Executor, str, None] = None,
+                 max_concurrency: Optional[int] = None,
+                 chunk_blocks: Optional[int] = None) -> None:
+        """Instanciates an AsyncLowMC object.
+
+        Args:
+            lowmc:              A LowMC object with the private key set
+            executor:           An Executor, or 'thread' (default) or
+                                'process' for an executor owned by this
+                                object, which is shut down by close()
+            max_concurrency:    Maximum number of calls running on the
+                                executor, defaults to the number of CPUs
+            chunk_blocks:       Number of blocks per submitted chunk,
+                                defaults to LowMC.batch_chunk
+        """
+        if (max_concurrency is None):
+            max_concurrency = os.cpu_count() or 1
+        assert (max_concurrency > 0), "Concurrency is not positive"
+        if (chunk_blocks is None):
+            chunk_blocks = lowmc.batch_chunk
+        assert (chunk_blocks > 0), "Chunk size is not positive"
+
+        self.__own_executor = not isinstance(executor, Executor)
+        if (executor is None) or (executor == 'thread'):
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        elif (executor == 'process'):
+            executor = ProcessPoolExecutor(max_workers=max_concurrency)
+        elif (not isinstance(executor, Executor)):
+            raise Exception('Argument is not a valid executor: {}'
+                            .format(executor))
+
+        self.__lowmc = lowmc
+        self.__executor = executor
+        self.__processes = isinstance(executor, ProcessPoolExecutor)
+        self.__semaphore = asyncio.Semaphore(max_concurrency)
+        self.__chunk_blocks = chunk_blocks
+        self.__running = 0
+
+    async def __aenter__(self) -> 'AsyncLowMC':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @property
+    def lowmc(self) -> LowMC:
+        """The wrapped LowMC object."""
+        return self.__lowmc
+
+    @property
+    def running(self) -> int:
+        """Number of chunks currently running on the executor."""
+        return self.__running
+
+    async def close(self) -> None:
+        """Shut down the executor if it is owned by this object.
+
+        Chunks that have not started yet are cancelled.
+        """
+        if (self.__own_executor):
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.__executor.shutdown(
+                    wait=True, cancel_futures=True))
+
+    async def encrypt(self, plaintext: bytes) -> bytes:
+        """Encryption of a plaintext, see LowMC.encrypt."""
+        return await self.__run('encrypt', bytes(plaintext))
+
+    async def decrypt(self, ciphertext: bytes) -> bytes:
+        """Decryption of a ciphertext, see LowMC.decrypt."""
+        return await self.__run('decrypt', bytes(ciphertext))
+
+    async def encrypt_many(self, blocks: Union[list, bytes]
+                           ) -> Union[list, bytes]:
+        """Encryption of many plaintexts, see LowMC.encrypt_many."""
+        return await self.__run_many('encrypt_many', blocks)
+
+    async def decrypt_many(self, blocks: Union[list, bytes]
+                           ) -> Union[list, bytes]:
+        """Decryption of many ciphertexts, see LowMC.decrypt_many."""
+        return await self.__run_many('decrypt_many', blocks)
+
+    async def __run_many(self, method: str,
+                         blocks: Union[list, bytes]) -> Union[list, bytes]:
+        size = self.__lowmc.blocksize_bytes
+        is_list = isinstance(blocks, (list, tuple))
+        if (is_list):
+            for block in blocks:
+                assert (len(block) == size), "Block has length != blocksize"
+            data = b''.join(blocks)
+        else:
+            data = memoryview(blocks).cast('B')
+            assert (len(data) % size == 0), \
+                "Buffer length is not a multiple of blocksize"
+
+        chunk_bytes = self.__chunk_blocks * size
+        futures = []
+        try:
+            for start in range(0, len(data), chunk_bytes):
+                futures.append(await self.__submit(
+                    method, bytes(data[start:start + chunk_bytes])))
+            result = b''.join(await asyncio.gather(*futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+        if (is_list):
+            return [result[i:i + size] for i in range(0, len(result), size)]
+        return result
+
+    async def __run(self, method: str, data: bytes) -> bytes:
+        return await (await self.__submit(method, data))
+
+    async def __submit(self, method: str, data: bytes) -> asyncio.Future:
+        # Waits for a free slot and submits one call to the executor. The
+        # slot is released when the call has finished on the executor, not
+        # when the awaiting task is cancelled, so cancelled calls still
+        # count while they run. Cancelling the returned future cancels the
+        # call if it has not started yet.
+        loop = asyncio.get_running_loop()
+        await self.__semaphore.acquire()
+        try:
+            if (self.__processes):
+                lowmc = self.__lowmc
+                future = self.__executor.submit(
+                    _process_call, lowmc.param, lowmc.backend,
+                    self.__key_bytes(), method, data)
+            else:
+                future = self.__executor.submit(
+                    getattr(self.__lowmc, method), data)
+        except BaseException:
+            self.__semaphore.release()
+            raise
+
+        self.__running += 1
+
+        def release(_: Future) -> None:
+            try:
+                loop.call_soon_threadsafe(self.__release)
+            except RuntimeError:
+                # The event loop is already closed
+                pass
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    def __release(self) -> None:
+        self.__running -= 1
+        self.__semaphore.release()
+
+    def __key_bytes(self) -> bytes:
+        lowmc = self.__lowmc
+        assert (lowmc.private_key is not None), "Private key not set"
+        padding = (8 * lowmc.keysize_bytes) - lowmc.keysize
+        return (int(lowmc.private_key) << padding).to_bytes(
+            lowmc.keysize_bytes, 'big')
+
+
+def _process_call(param: Union[str, tuple], backend: str, key: bytes,
+                  method: str, data: bytes) -> bytes:
+    # Runs in a worker process of a process executor
+    cache_key = (param, backend, key)
+    lowmc = _process_objects.get(cache_key)
+    if (lowmc is None):
+        lowmc = LowMC(param, backend)
+        lowmc.private_key = key
+        _process_objects[cache_key] = lowmc
+        while (len(_process_objects) > _process_objects_maxsize):
+            _process_objects.popitem(last=False)
+    else:
+        _process_objects.move_to_end(cache_key)
+    return getattr(lowmc, method)(data)
@@ -0,0 +1,292 @@
+'''
+LowMC Blockcipher Benchmarks
+Author: Thorsten Knoll
+
+Description:
+Measures every part of LowMC separately for the
+Picnic and Picnic3 parameter sets and all backends:
+the cold start of a fresh interpreter (import and
+first encryption), construction, loading the
+constants, computing and loading the inverse linear
+layers, key setup,
+single block en- and decryption latency, the
+throughput of encrypt_many for several batch sizes,
+the MPC simulation of simulate_mpc and the Merkle
+tree hash of modes.py.
+
+All results are times in seconds (lower is better) and
+are written to a JSON file. If a baseline file exists,
+the results are compared against it and the script
+exits with status 1 if a measurement got slower than
+the threshold allows.
+
+With --calibrate, the backends are calibrated with
+LowMC.calibrate instead (see lowmc.CALIBRATION_FILE).
+
+Usage:
+  bench_lowmc.py [--params picnic-L1 ...] [--backends int ...]
+                 [--save-baseline] [--threshold 1.25] [--calibrate]
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import lowmc
+from lowmc import LowMC, LowMCStats
+from modes import merkle_hash
+
+PARAMS = ('picnic-L1', 'picnic-L3', 'picnic-L5',
+          'picnic3-L1', 'picnic3-L3', 'picnic3-L5')
+BATCH_SIZES = (1, 16, 256, 4096)
+# Parallel repetitions of Picnic-L1 (ZKBoo)
+MPC_REPETITIONS = 219
+# Number of blocks hashed with merkle_hash
+HASH_BLOCKS = 4096
+# Number of fresh interpreters timed for the cold start
+STARTUP_RUNS = 5
+
+# Run in a fresh interpreter, prints the seconds until lowmc is imported
+# and until the first block is encrypted
+STARTUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import lowmc
+imported = time.perf_counter()
+cipher = lowmc.LowMC({param!r}, {backend!r})
+cipher.private_key = bytes(cipher.keysize_bytes)
+cipher.encrypt(bytes(cipher.blocksize_bytes))
+print(json.dumps([imported - start, time.perf_counter() - start]))
+'''
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark LowMC.')
+    parser.add_argument('--params', nargs='+', default=PARAMS)
+    parser.add_argument('--backends', nargs='+',
+                        default=[b for b in LowMC.backends
+                                 if b != 'bitvector'])
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='number of timed calls per latency measurement')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='allowed slowdown factor against the baseline')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='calibrate the backends and store the fastest')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        params = [param for param in args.params if has_constants(param)]
+        for param, result in sorted(LowMC.calibrate(params).items()):
+            print('{}: fastest backend {}, batch path from {}'
+                  .format(param, result['backend'],
+                          result['sliced_min_blocks']))
+        print('calibration written to ' + lowmc.CALIBRATION_FILE)
+        return 0
+
+    results = {}
+    for param in args.params:
+        if not has_constants(param):
+            print('skipping ' + param + ': no constants file')
+            continue
+        for backend in args.backends:
+            print('benchmarking ' + param + ' ' + backend)
+            results.setdefault(param, {})[backend] = \
+                benchmark(param, backend, args.repeat)
+
+    report = {'meta': metadata(), 'results': results}
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=2, sort_keys=True)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+        print('baseline written to ' + args.baseline)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        return 1 if regressions else 0
+
+    return 0
+
+
+def has_constants(param):
+    ''' Whether LowMC finds a constants file of the parameter set. '''
+    path = lowmc._find_constants(param)
+    return os.path.exists(path + '.bin') or os.path.exists(path + '.dat')
+
+
+def benchmark(param, backend, repeat):
+    ''' Returns a dict of measurement name to seconds. '''
+    result = {}
+
+    # Cold start of a short-lived process, from the import of the module
+    # to the first ciphertext
+    result['startup_import'], result['startup_first_encrypt'] = \
+        startup(param, backend)
+
+    # Construction, the constants are only loaded on first use
+    result['construct'] = median(lambda: LowMC(param, backend), repeat)
+
+    cipher = LowMC(param, backend)
+    key = os.urandom(cipher.keysize_bytes)
+    block = os.urandom(cipher.blocksize_bytes)
+
+    result.update(constants_phases(param, backend, key, block))
+
+    # First key setup includes loading the constants (file loading) and
+    # the tables of the key setup (e.g. hoisted), the tables of the round
+    # loop (e.g. m4rm) are built by the first encryption
+    def set_key():
+        cipher.private_key = key
+    lowmc.clear_constants_cache()
+    result['key_setup_first'] = once(set_key)
+    result['key_setup'] = median(set_key, repeat)
+
+    result['encrypt'] = median(lambda: cipher.encrypt(block), repeat)
+    result['decrypt'] = median(lambda: cipher.decrypt(block), repeat)
+
+    # Batch throughput as seconds per block
+    for size in BATCH_SIZES:
+        data = os.urandom(size * cipher.blocksize_bytes)
+        runs = max(1, repeat // size)
+        result['batch_{}'.format(size)] = \
+            median(lambda: cipher.encrypt_many(data), runs) / size
+
+    # MPC simulation as seconds per repetition
+    shares = [os.urandom(MPC_REPETITIONS * cipher.keysize_bytes)
+              for _ in range(3)]
+    tapes = [os.urandom(MPC_REPETITIONS * cipher.tape_bytes)
+             for _ in range(3)]
+    result['simulate_mpc'] = median(
+        lambda: cipher.simulate_mpc(shares, block, tapes),
+        max(1, repeat // 10)) / MPC_REPETITIONS
+
+    # Hash throughput as seconds per block, if the hash supports the set
+    if ((cipher.blocksize == cipher.keysize) and (cipher.blocksize % 8 == 0)):
+        data = os.urandom(HASH_BLOCKS * cipher.blocksize_bytes)
+        result['merkle_hash'] = median(
+            lambda: merkle_hash(cipher, [data]),
+            max(1, repeat // 10)) / HASH_BLOCKS
+
+    return result
+
+
+def constants_phases(param, backend, key, block):
+    ''' Returns the seconds to load the constants, to compute the inverse
+        linear layers and to load them back from the inverse file, as
+        recorded by LowMCStats for a cold constants cache.
+    '''
+    # On a copy of the constants in a temporary directory, loaded as the
+    # custom parameter set of the same shape, so the inverse file next to
+    # the packaged constants is neither removed nor written
+    path = lowmc._find_constants(param)
+    extension = '.bin' if os.path.exists(path + '.bin') else '.dat'
+    custom = lowmc.parameter_set(param)[1:]
+    cwd = os.getcwd()
+    snapshots = []
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(path + extension,
+                    os.path.join(directory,
+                                 lowmc.parameter_set(custom)[0] + extension))
+        os.chdir(directory)
+        try:
+            for _ in range(2):
+                lowmc.clear_constants_cache()
+                stats = LowMCStats()
+                cipher = LowMC(custom, backend, stats)
+                cipher.private_key = key
+                cipher.decrypt(block)
+                snapshots.append(stats.snapshot())
+        finally:
+            os.chdir(cwd)
+            lowmc.clear_constants_cache()
+    assert snapshots[1]['inversion']['calls'] == 0, \
+        'Inverse file was not written'
+    return {'load_constants': snapshots[0]['load_constants']['seconds'],
+            'inverse_compute': snapshots[0]['inversion']['seconds'],
+            'inverse_load': snapshots[1]['load_inverse']['seconds']}
+
+
+def startup(param, backend):
+    ''' Returns the median seconds to import lowmc and to encrypt the
+        first block in a fresh interpreter.
+    '''
+    script = STARTUP_SCRIPT.format(param=param, backend=backend)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    runs = [json.loads(subprocess.run([sys.executable, '-c', script],
+                                      cwd=directory, check=True,
+                                      capture_output=True).stdout)
+            for _ in range(STARTUP_RUNS)]
+    return tuple(statistics.median(run[i] for run in runs) for i in (0, 1))
+
+
+def once(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def median(function, repeat):
+    function()
+    return statistics.median(once(function) for _ in range(repeat))
+
+
+def metadata():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'numpy': numpy_version,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, threshold):
+    ''' Returns one line per measurement slower than threshold times
+        the baseline. Measurements missing in either file are skipped.
+    '''
+    regressions = []
+    for param, backends in sorted(results.items()):
+        for backend, measurements in sorted(backends.items()):
+            base = baseline.get(param, {}).get(backend, {})
+            for name, value in sorted(measurements.items()):
+                if name in base and value > base[name] * threshold:
+                    regressions.append('{} {} {}: {:.6f}s (baseline {:.6f}s)'
+                                       .format(param, backend, name, value,
+                                               base[name]))
+    return regressions
+
+
+def print_results(results):
+    for param, backends in sorted(results.items()):
+        for backend, measurements in sorted(backends.items()):
+            print('------------------------------')
+            print(param + ' ' + backend)
+            print('------------------------------')
+            for name, value in sorted(measurements.items()):
+                print('{:18s} {:12.3f} us'.format(name, value * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,8 +15,11 @@ under MIT Licence. See the LICENCE.md file.
 ---------------------------------------------------
 '''
 
+from array import array
+import hashlib
 import sys
-from BitVector import BitVector
+import gf2
+from lowmc import BINARY_HEADER, BINARY_MAGIC, parameter_set
 
 # Parameterset Picnic
 blocksize = None
@@ -25,31 +28,24 @@ rounds = None
 filename = None
 
 def main():
-    ''' Use the global parameters `blocksize`, `keysize` and `rounds`
-        to create the set of matrices and constants for the corresponding
-        LowMC instance. Save those in a file named
-        `matrices_and_constants.dat`.
+    ''' Create the set of matrices and constants for a LowMC instance.
+        The instance is either a named parameter set from `PARAMETER_SETS`
+        in `lowmc.py` (e.g. `picnic-L1` or `picnic3-L1`) or given as
+        `<blocksize> <keysize> <sboxes> <rounds>`. Save those in a text
+        file named `<name>.dat`, or with the option `--binary` in a binary
+        file `<name>.bin`.
     '''
 
     # Parse args
-    param = sys.argv[1]
-    if (param == 'picnic-L1'):
-      blocksize = 128
-      keysize   = 128
-      rounds    = 20
-      filename  = 'picnic-L1.dat'
-    elif (param == 'picnic-L3'):
-      blocksize = 192
-      keysize   = 192
-      rounds    = 30
-      filename  = 'picnic-L3.dat'
-    elif (param == 'picnic-L5'):
-      blocksize = 256
-      keysize   = 256
-      rounds    = 38
-      filename  = 'picnic-L5.dat'
-
-    gen = grain_ssg()
+    binary = '--binary' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != '--binary']
+    if (len(args) == 4):
+        param = tuple(int(arg) for arg in args)
+    else:
+        param = args[0]
+    filename, blocksize, keysize, sboxes, rounds = parameter_set(param)
+
+    gen = GrainSSG()
 
     linlayers = []
     for _ in range(rounds):
@@ -57,75 +53,86 @@ def main():
 
     round_constants = []
     for _ in range(rounds):
-        constant = [next(gen) for _ in range(blocksize)]
-        round_constants.append(constant)
+        round_constants.append(gen.read(blocksize))
 
     roundkey_matrices = []
     for _ in range(rounds + 1):
         mat = instantiate_matrix(blocksize, keysize, gen)
         roundkey_matrices.append(mat)
 
+    if binary:
+        write_binary(filename + '.bin', blocksize, keysize, sboxes, rounds,
+                     linlayers, round_constants, roundkey_matrices)
+    else:
+        write_text(filename + '.dat', blocksize, keysize, rounds,
+                   linlayers, round_constants, roundkey_matrices)
+
+def write_text(filename, blocksize, keysize, rounds,
+               linlayers, round_constants, roundkey_matrices):
+    ''' Write the matrices and constants as bitstrings, one row per line.
+        Rows are integers with the first bit in the MSB.
+    '''
     with open(filename, 'w') as matfile:
         s = str(blocksize) + '\n' + str(keysize) + '\n' + str(rounds) + '\n'
         matfile.write(s)
         for r in range(rounds):
             s = ''
             for row in linlayers[r]:
-                bv = BitVector(bitlist = row)
-                s += str(bv) + '\n'
+                s += format(row, '0{}b'.format(blocksize)) + '\n'
             matfile.write(s)
 
         for r in range(rounds):
-            bv = BitVector(bitlist = round_constants[r])
-            s = str(bv) + '\n'
+            s = format(round_constants[r], '0{}b'.format(blocksize)) + '\n'
             matfile.write(s)
 
         for r in range(rounds + 1):
             s = ''
             for row in roundkey_matrices[r]:
-                bv = BitVector(bitlist = row)
-                s += str(bv) + '\n'
+                s += format(row, '0{}b'.format(keysize)) + '\n'
             matfile.write(s)
 
+def write_binary(filename, blocksize, keysize, sboxes, rounds,
+                 linlayers, round_constants, roundkey_matrices):
+    ''' Write the matrices and constants as bit-packed rows behind a header
+        with the parameters and a checksum, see `BINARY_HEADER` in
+        `lowmc.py`.
+    '''
+    payload = bytearray()
+    for r in range(rounds):
+        for row in linlayers[r]:
+            payload += pack_row(row, blocksize)
+    for r in range(rounds):
+        payload += pack_row(round_constants[r], blocksize)
+    for r in range(rounds + 1):
+        for row in roundkey_matrices[r]:
+            payload += pack_row(row, keysize)
+
+    header = BINARY_HEADER.pack(BINARY_MAGIC, blocksize, keysize, sboxes,
+                                rounds, hashlib.sha256(payload).digest())
+    with open(filename, 'wb') as matfile:
+        matfile.write(header)
+        matfile.write(payload)
+
+def pack_row(row, width):
+    ''' Pack a row of `width` bits into bytes, first bit in the MSB of the
+        first byte and zero padding at the end.
+    '''
+    row_bytes = (width + 7) // 8
+    return (row << ((8 * row_bytes) - width)).to_bytes(row_bytes, 'big')
+
 def instantiate_matrix(n, m, gen):
     ''' Instantiate a matrix of maximal rank using bits from the
-        generatator `gen`.
+        generatator `gen`. The n rows are integers of m bits.
     '''
     while True:
-        mat = []
-        for _ in range(n):
-            row = []
-            for _ in range(m):
-                row.append(next(gen))
-            mat.append(row)
-        if rank(mat) >= min(n, m):
+        mat = [gen.read(m) for _ in range(n)]
+        if gf2.rank(mat, m) >= min(n, m):
             return mat
 
-def rank(matrix):
-    ''' Determine the rank of a binary matrix. '''
-    # Copy matrix
-    mat = [[x for x in row] for row in matrix]
-    
-    n = len(matrix)
-    m = len(matrix[0])
-    for c in range(m):
-        if c > n - 1:
-            return n
-        r = c
-        while mat[r][c] != 1:
-            r += 1
-            if r >= n:
-                return c
-        mat[c], mat[r] = mat[r], mat[c]
-        for r in range(c + 1, n):
-            if mat[r][c] == 1:
-                for j in range(m):
-                    mat[r][j] ^= mat[c][j]
-    return m
-
-
 def grain_ssg():
-    ''' A generator for using the Grain LSFR in a self-shrinking generator. '''
+    ''' A generator for using the Grain LSFR in a self-shrinking generator.
+        Yields one bit at a time, see `GrainSSG` for the fast version.
+    '''
     state = [1 for _ in range(80)]
     index = 0
     # Discard first 160 bits
@@ -152,6 +159,116 @@ def grain_ssg():
         index %= 80
 
 
+class GrainSSG(object):
+    ''' Word-parallel version of `grain_ssg` with the same output.
+
+        The LFSR sequence satisfies s[t + 80] = s[t] ^ s[t + 13] ^ s[t + 23]
+        ^ s[t + 38] ^ s[t + 51] ^ s[t + 62], and thereby also the same
+        relation with all distances multiplied by any power of two K (the
+        characteristic polynomial raised to the power K). With K = 64, the
+        1152 bits s[t + 5120] ... s[t + 6271] only depend on the window
+        s[t] ... s[t + 5119] and are computed with a few operations on
+        integers. The self-shrinking step then selects the output bits of
+        16 LFSR bits at once with a lookup table.
+    '''
+
+    taps = (0, 13, 23, 38, 51, 62)
+    length = 80
+    jump = 64
+
+    def __init__(self):
+        # Bit i of a window is s[t + i]
+        window = (1 << self.length) - 1
+        size = self.length
+        while size < self.length * self.jump:
+            window |= self.step(window >> (size - self.length), 1) << size
+            size += 18
+        self.window = window & ((1 << (self.length * self.jump)) - 1)
+        # The first 160 bits after the initial state are discarded, so the
+        # choice bits are the even bits from s[240] on
+        self.pending = self.window >> 240
+        self.pending_bits = (self.length * self.jump) - 240
+        self.buffer = 0
+        self.buffered = 0
+        self.table = self.shrink_table()
+
+    @classmethod
+    def step(cls, window, jump):
+        ''' The next 18 * `jump` bits of the sequence after a window of
+            80 * `jump` bits.
+        '''
+        new = 0
+        for tap in cls.taps:
+            new ^= window >> (tap * jump)
+        return new & ((1 << (18 * jump)) - 1)
+
+    @staticmethod
+    def shrink_table():
+        ''' Output bits and their number for 8 pairs of LFSR bits, the
+            choice bit of pair j is bit 2j of the index and the value is
+            bit 2j + 1. The first output bit is the most significant one.
+        '''
+        table = []
+        for chunk in range(1 << 16):
+            value = 0
+            count = 0
+            for j in range(8):
+                if (chunk >> (2 * j)) & 1:
+                    value = (value << 1) | ((chunk >> (2 * j + 1)) & 1)
+                    count += 1
+            table.append((value, count))
+        return table
+
+    def refill(self):
+        ''' Shrink the pending LFSR bits into the output buffer and compute
+            the next ones.
+        '''
+        chunks = array('H')
+        chunks.frombytes(self.pending.to_bytes(self.pending_bits // 8,
+                                               'little'))
+        if sys.byteorder == 'big':
+            chunks.byteswap()
+        table = self.table
+        value = 0
+        count = 0
+        for chunk in chunks:
+            bits, n = table[chunk]
+            value = (value << n) | bits
+            count += n
+        self.buffer = (self.buffer << count) | value
+        self.buffered += count
+
+        size = self.length * self.jump
+        new = self.step(self.window, self.jump)
+        self.window = (self.window >> (18 * self.jump)) \
+            | (new << (size - (18 * self.jump)))
+        self.pending = new
+        self.pending_bits = 18 * self.jump
+
+    def read(self, count):
+        ''' The next `count` output bits as an integer, the first bit in
+            the MSB.
+        '''
+        # Long reads are joined as bitstrings to avoid shifting ever longer
+        # integers
+        pieces = []
+        while self.buffered < count:
+            if self.buffered:
+                pieces.append(format(self.buffer,
+                                     '0{}b'.format(self.buffered)))
+                count -= self.buffered
+                self.buffer = 0
+                self.buffered = 0
+            self.refill()
+        self.buffered -= count
+        result = self.buffer >> self.buffered
+        self.buffer &= (1 << self.buffered) - 1
+        if pieces:
+            pieces.append(format(result, '0{}b'.format(count)))
+            return int(''.join(pieces), 2)
+        return result
+
+
 if __name__ == '__main__':
     main()
 
@@ -0,0 +1,201 @@
+"""Linear algebra over GF(2) on bit-packed rows.
+
+A matrix is a sequence of rows, each row an integer holding column j in bit
+(width - 1 - j), i.e. the first column is the most significant bit. A vector
+is an integer in the same bit order. This is the representation of the
+matrices in the LowMC constants files, used by the cipher and the generator.
+"""
+
+from typing import Sequence
+
+__author__ = "Thorsten Knoll"
+__copyright__ = "Thorsten Knoll"
+__license__ = "mit"
+
+
+def rank(mat: Sequence[int], width: int) -> int:
+    """Rank of a matrix.
+
+    Args:
+        mat:    The rows of the matrix
+        width:  The number of columns
+
+    Returns:
+        The rank of the matrix
+
+    """
+    return _eliminate(list(mat), width, width, False)
+
+
+def invert(mat: Sequence[int]) -> tuple:
+    """Inverse of a square matrix by Gauss-Jordan elimination.
+
+    The rows of the matrix and of the identity are eliminated together as
+    one integer of twice the width.
+
+    Args:
+        mat:    The rows of an invertible n x n matrix
+
+    Returns:
+        A tuple with the rows of the inverse matrix
+
+    """
+    n = len(mat)
+    rows = [(row << n) | (1 << (n - 1 - i)) for i, row in enumerate(mat)]
+    if (_eliminate(rows, 2 * n, n, True) < n):
+        raise Exception('Matrix is not invertible')
+    mask = (1 << n) - 1
+    return tuple(row & mask for row in rows)
+
+
+def solve(mat: Sequence[int], rhs: Sequence[int], width: int) -> tuple:
+    """Solution X of mat * X = rhs for a square matrix by Gauss-Jordan
+    elimination.
+
+    The rows of the matrix and of the right hand side are eliminated
+    together as one integer, so mat^-1 * rhs is computed without the
+    inverse of the matrix.
+
+    Args:
+        mat:    The rows of an invertible n x n matrix
+        rhs:    The n rows of the right hand side
+        width:  The number of columns of the right hand side
+
+    Returns:
+        A tuple with the n rows of the solution
+
+    """
+    n = len(mat)
+    rows = [(row << width) | rhs[i] for i, row in enumerate(mat)]
+    if (_eliminate(rows, n + width, n, True) < n):
+        raise Exception('Matrix is not invertible')
+    mask = (1 << width) - 1
+    return tuple(row & mask for row in rows)
+
+
+def _eliminate(rows: list, width: int, columns: int, reduce: bool) -> int:
+    # Method of the four russians (M4RI): the first `columns` columns are
+    # processed in blocks of 8. For a block, up to 8 pivot rows are found
+    # and reduced against each other like in the plain elimination, then
+    # all other rows are cleared in the block with a single lookup into the
+    # table of all XOR combinations of the pivot rows. Only the rows below
+    # the pivots are cleared, or all rows if `reduce` is set, which leaves
+    # the pivots in row echelon respectively reduced row echelon form.
+    # Returns the number of pivots, the rows are changed in place.
+    n = len(rows)
+    rank = 0
+    for col in range(0, columns, 8):
+        if (rank == n):
+            break
+        size = min(8, columns - col)
+        shift = width - col - size
+        pivots = []
+        for c in range(col, col + size):
+            bit = 1 << (width - 1 - c)
+            for i in range(rank + len(pivots), n):
+                row = rows[i]
+                for pivot in pivots:
+                    if (row & pivot[0]):
+                        row ^= pivot[1]
+                rows[i] = row
+                if (row & bit):
+                    break
+            else:
+                continue
+            top = rank + len(pivots)
+            rows[i], rows[top] = rows[top], row
+            for pivot in pivots:
+                if (pivot[1] & bit):
+                    pivot[1] ^= row
+            pivots.append([bit, row])
+
+        if (not pivots):
+            continue
+
+        # table[w] is the combination of pivot rows clearing the pivot
+        # columns of a row with the bits w in this block
+        table = [0]
+        for b in range(size):
+            bit = 1 << (shift + b)
+            entry = 0
+            for pivot in pivots:
+                if (pivot[0] == bit):
+                    entry = pivot[1]
+            table += [value ^ entry for value in table]
+
+        mask = (1 << size) - 1
+        end = rank + len(pivots)
+        for i, pivot in enumerate(pivots):
+            rows[rank + i] = pivot[1]
+        others = range(end, n)
+        if (reduce):
+            others = list(range(rank)) + list(others)
+        for i in others:
+            rows[i] ^= table[(rows[i] >> shift) & mask]
+        rank = end
+    return rank
+
+
+def multiply_vec(mat: Sequence[int], vec: int) -> int:
+    """Matrix-vector product.
+
+    Args:
+        mat:    The rows of the matrix
+        vec:    A vector of the width of the rows
+
+    Returns:
+        The product, the first row yields the most significant bit
+
+    """
+    result = 0
+    for row in mat:
+        result = (result << 1) | ((row & vec).bit_count() & 1)
+    return result
+
+
+def multiply_mat(mat_a: Sequence[int], mat_b: Sequence[int]) -> list:
+    """Matrix-matrix product.
+
+    Row i of the product is the XOR of the rows j of mat_b for all bits j
+    set in row i of mat_a.
+
+    Args:
+        mat_a:  The rows of the left matrix, of width len(mat_b)
+        mat_b:  The rows of the right matrix
+
+    Returns:
+        A list with the rows of the product
+
+    """
+    n = len(mat_b)
+    result = []
+    for row in mat_a:
+        acc = 0
+        while (row):
+            low = row & -row
+            acc ^= mat_b[n - low.bit_length()]
+            row ^= low
+        result.append(acc)
+    return result
+
+
+def transpose(mat: Sequence[int], width: int) -> list:
+    """Transpose of a matrix.
+
+    Args:
+        mat:    The rows of the matrix
+        width:  The number of columns
+
+    Returns:
+        A list of width rows of len(mat) bits
+
+    """
+    n = len(mat)
+    result = [0] * width
+    for i, row in enumerate(mat):
+        bit = 1 << (n - 1 - i)
+        while (row):
+            low = row & -row
+            result[width - low.bit_length()] |= bit
+            row ^= low
+    return result
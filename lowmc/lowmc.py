@@ -1,13 +1,931 @@
 """The LowMC blockcipher in Python."""
 
+from array import array
 from BitVector import BitVector
+from collections import OrderedDict
+import hashlib
+import mmap
 import os
-from typing import Optional
+import struct
+import sys
+import threading
+import time
+from typing import Optional, Union
+
+import gf2
+
+# NumPy takes longer to import than everything else, so it is imported by
+# the first batch call, see _import_numpy. None if not (yet) imported.
+np = None
+_numpy_imported = False
 
 __author__ = "Thorsten Knoll"
 __copyright__ = "Thorsten Knoll"
 __license__ = "mit"
 
+# Named parameter sets: blocksize, keysize, number of sboxes and number of
+# rounds. The constants are read from the file of the same name with the
+# extension .bin or .dat. The Picnic3 sets have a full sbox layer.
+PARAMETER_SETS = {
+    'picnic-L1': (128, 128, 10, 20),
+    'picnic-L3': (192, 192, 10, 30),
+    'picnic-L5': (256, 256, 10, 38),
+    'picnic3-L1': (129, 129, 43, 4),
+    'picnic3-L3': (192, 192, 64, 4),
+    'picnic3-L5': (255, 255, 85, 4),
+}
+
+# Header of the binary constants files (picnic-L*.bin): magic, blocksize,
+# keysize, number of sboxes, number of rounds and the SHA-256 digest of
+# the payload. The payload holds the linear layer matrices, the round
+# constants and the round key matrices in this order, as bit-packed rows
+# of (width + 7) // 8 bytes with the first bit in the MSB of the first byte.
+BINARY_MAGIC = b'LMCB'
+BINARY_HEADER = struct.Struct('>4sHHHH32s')
+
+# Header of the inverse linear layer files (picnic-L*.inv), which are
+# written next to the constants file on the first decryption: magic,
+# blocksize, keysize, number of sboxes, number of rounds, the SHA-256
+# digest of the constants they were computed from (the digest in the
+# header of a binary constants file, the digest of a text file) and the
+# SHA-256 digest of the payload. The payload holds the bit-packed rows of
+# the inverse matrices like the payload of the binary constants files.
+INVERSE_MAGIC = b'LMCI'
+INVERSE_HEADER = struct.Struct('>4sHHHH32s32s')
+
+# Process-wide cache of the read-only constants (linear layers, their
+# inverses, round constants and round key matrices), shared by all LowMC
+# instances of the same parameter set whatever their backend.
+# Entries are evicted in least recently used order once the cache holds
+# more than _constants_cache_maxsize entries (None means unbounded).
+_constants_cache = OrderedDict()
+_constants_cache_maxsize = None
+_constants_cache_lock = threading.Lock()
+
+# Serializes the lazy inversion of the linear layers
+_inverse_lock = threading.Lock()
+
+# Header of the shared memory segment handed to the worker processes of
+# LowMC.encrypt_parallel: magic, blocksize, keysize, number of sboxes,
+# number of rounds, whether the inverse linear layers are included and the
+# SHA-256 digest of the constants. It is followed by the private key
+# and the bit-packed linear layers, inverse linear layers, round constants,
+# round key matrices and round keys.
+SHARED_MAGIC = b'LMCS'
+SHARED_HEADER = struct.Struct('>4sHHHH?32s')
+
+# The LowMC object and the shared memory segments (constants and data) of
+# a worker process
+_parallel_worker = None
+
+# Known answers a backend has to reproduce before LowMC.calibrate times
+# it: key, plaintext and ciphertext of the first Picnic testvector. The
+# 129 bit blocks of picnic3-L1 are padded with zero bits to 17 bytes.
+KNOWN_ANSWERS = {
+    'picnic-L1': ('80' + '00' * 15, 'ABFF' + '00' * 14,
+                  '0E30720B9F64D5C2A7771C8C238D8F70'),
+    'picnic-L3': ('80' + '00' * 23, 'ABFF' + '00' * 22,
+                  'A85B8244344A2E1B10A17BAB043073F6'
+                  'BB649AE6AF659F6F'),
+    'picnic-L5': ('80' + '00' * 31, 'ABFF' + '00' * 30,
+                  'B8F20A888A0A9EC4E495F1FB439ABDDE'
+                  '18C1D3D29CF20DF4B10A567AA02C7267'),
+    'picnic3-L1': ('80' + '00' * 16, 'ABFF' + '00' * 15,
+                   '2FD7D5425EE35E667C972F12FB153E9D80'),
+}
+
+# Results of LowMC.calibrate per parameter set: the fastest backend for
+# single blocks and per backend the smallest batch for which the NumPy
+# batch path is faster than processing the blocks one by one. The file is
+# read once per process, by the first LowMC object. _calibration holds the
+# path and the contents of the file read last.
+CALIBRATION_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'lowmc',
+                                'calibration.json')
+_calibration = (None, {})
+_calibration_lock = threading.Lock()
+
+
+def clear_constants_cache() -> None:
+    """Drop all cached constants.
+
+    Existing LowMC objects keep their constants, new objects load them again.
+    """
+    with _constants_cache_lock:
+        _constants_cache.clear()
+
+
+def set_constants_cache_size(maxsize: Optional[int] = None) -> None:
+    """Bound the number of cached constant sets.
+
+    Args:
+        maxsize:    Maximum number of cached constant sets,
+                    None for an unbounded cache
+    """
+    global _constants_cache_maxsize
+    assert (maxsize is None) or (maxsize >= 0), "Cache size is negative"
+    with _constants_cache_lock:
+        _constants_cache_maxsize = maxsize
+        _evict_constants()
+
+
+def parameter_set(param: Union[str, tuple]) -> tuple:
+    """Resolve a parameter set.
+
+    Args:
+        param:  The name of a parameter set in PARAMETER_SETS or a tuple
+                (blocksize, keysize, number_sboxes, number_rounds)
+
+    Returns:
+        A tuple (name, blocksize, keysize, number_sboxes, number_rounds),
+        the name of a custom set is 'lowmc-<blocksize>-<keysize>-
+        <number_sboxes>-<number_rounds>'
+
+    """
+    if (isinstance(param, str)):
+        if (param not in PARAMETER_SETS):
+            raise Exception('Argument is not a valid LowMC parameter set: {}'
+                            .format(param))
+        return (param,) + PARAMETER_SETS[param]
+
+    if ((len(param) != 4) or any((not isinstance(value, int)) or (value < 1)
+                                 for value in param)
+            or (3 * param[2] > param[0])):
+        raise Exception('Argument is not a valid LowMC parameter set: {}'
+                        .format(param))
+    return ('lowmc-{}-{}-{}-{}'.format(*param),) + tuple(param)
+
+
+def _import_numpy() -> Optional[object]:
+    # Returns the numpy module or None if it is not installed
+    global np, _numpy_imported
+    if (not _numpy_imported):
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_imported = True
+    return np
+
+
+def _find_constants(name: str) -> str:
+    # Path of the constants files of a parameter set without the extension.
+    # The files next to this module take precedence, so a stray file in
+    # the current working directory cannot replace the packaged constants.
+    # Only parameter sets without packaged files, e.g. written by
+    # generator.py, are looked up in the current working directory. The
+    # inverse file is read from and written to the directory of the
+    # constants file found.
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for path in (os.path.join(directory, name), name):
+        for extension in ('.bin', '.dat'):
+            if (os.path.exists(path + extension)):
+                return path
+    return name
+
+
+def _get_calibration(name: str) -> dict:
+    # The calibration of a parameter set, empty if there is none
+    global _calibration
+    with _calibration_lock:
+        path = CALIBRATION_FILE
+        if (_calibration[0] != path):
+            calibration = {}
+            if (os.path.exists(path)):
+                import json
+                try:
+                    with open(path) as infile:
+                        calibration = json.load(infile)
+                except (OSError, ValueError):
+                    pass
+            _calibration = (path, calibration)
+        return _calibration[1].get(name, {})
+
+
+def _median_time(function: callable, repeat: int) -> float:
+    # Median seconds of a call, after one untimed call
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+# The 3-bit sbox of LowMC and its inverse
+SBOX = (0x00, 0x01, 0x03, 0x06, 0x07, 0x04, 0x05, 0x02)
+SBOX_INV = (0x00, 0x01, 0x07, 0x02, 0x05, 0x06, 0x03, 0x04)
+
+# Lookup tables substituting 5 sboxes (15 bits of an integer state) at once,
+# built on first use and shared by all LowMC objects. The table of the
+# inverse sbox is only built for the first decryption. They are arrays of
+# 16-bit entries, 64 KB instead of more than 1 MB as a list of integers.
+_sbox_layers = {}
+_sbox_layers_lock = threading.Lock()
+
+
+def _get_sbox_layer(sbox: list) -> array:
+    key = tuple(sbox)
+    with _sbox_layers_lock:
+        if (key not in _sbox_layers):
+            _sbox_layers[key] = _build_sbox_layer(sbox)
+        return _sbox_layers[key]
+
+
+def _build_sbox_layer(sbox: list) -> array:
+    # The 3-bit chunks are reversed in the Picnic implementation, see
+    # BitVectorBackend.apply_sbox. So the table for one sbox maps the chunk
+    # value x to reverse(sbox[reverse(x)]).
+    def reverse(x: int) -> int:
+        return ((x & 0x01) << 2) | (x & 0x02) | ((x & 0x04) >> 2)
+
+    table = [reverse(sbox[reverse(x)]) for x in range(8)]
+    table_6 = [(high << 3) | low for high in table for low in table]
+    table_12 = [(high << 6) | low for high in table_6 for low in table_6]
+    return array('H', [(high << 12) | low for high in table
+                       for low in table_12])
+
+
+def _substitute(state: int, table: array, shift: int, chunks: int) -> int:
+    # Sbox layer on an integer state with a table of _get_sbox_layer. Bit i
+    # of a BitVector is bit (blocksize - 1 - i) of the integer, so the
+    # sboxes are the bits from shift on. They are substituted 5 at a time,
+    # starting with the lowest.
+    result = state & ((1 << shift) - 1)
+    for _ in range(chunks):
+        result |= table[(state >> shift) & 0x7FFF] << shift
+        shift += 15
+    return result
+
+
+def _multiply_m4rm(tables: tuple, vec: int) -> int:
+    # One table per byte of the input, least significant byte first
+    result = 0
+    for table in tables:
+        result ^= table[vec & 0xFF]
+        vec >>= 8
+    return result
+
+
+def _build_m4rm_tables(mat: tuple, width: int) -> tuple:
+    # Method of the four russians: the table for byte g of the input
+    # holds at index c the XOR of the matrix columns selected by c,
+    # where bit b of c is bit (8 * g + b) of the input integer.
+    columns = gf2.transpose(mat, width)[::-1]
+    columns += [0] * (8 * ((width + 7) // 8) - width)
+
+    tables = []
+    for g in range(len(columns) // 8):
+        table = [0]
+        for column in columns[8 * g:8 * (g + 1)]:
+            table += [entry ^ column for entry in table]
+        tables.append(table)
+    return tuple(tables)
+
+
+class LowMCStats(object):
+    """Time and number of calls per phase of LowMC.
+
+    Attach an instance to one or more LowMC objects (argument `stats` of the
+    constructor or the property of the same name) to record where the time
+    goes. The round loops only check for a stats object once per block (or
+    once per batch of blocks with NumPy), so LowMC objects without one run
+    at full speed. Recording is thread-safe.
+
+    The phases are 'load_constants' (first use), 'load_inverse' and
+    'inversion' (reading or computing the inverse linear layers on the first
+    decryption), 'key_addition', 'constant_addition', 'sbox' and
+    'linear_layer' (round loops) as well as 'encrypt' and 'decrypt' with one
+    call per block. The hoisted backend has no constant addition, its round
+    constants are part of the round keys. With NumPy, a round loop phase is
+    called once per batch of blocks.
+    """
+
+    __slots__ = ['__calls', '__seconds', '__lock']
+
+    phases = ('load_constants', 'load_inverse', 'inversion', 'key_addition',
+              'constant_addition', 'sbox', 'linear_layer', 'encrypt',
+              'decrypt')
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Set all counters to zero."""
+        with self.__lock:
+            self.__calls = dict.fromkeys(self.phases, 0)
+            self.__seconds = dict.fromkeys(self.phases, 0.0)
+
+    def add(self, phase: str, seconds: float, calls: int = 1) -> None:
+        """Record calls to a phase.
+
+        Args:
+            phase:      One of LowMCStats.phases
+            seconds:    Time spent in the calls
+            calls:      Number of calls
+        """
+        with self.__lock:
+            self.__calls[phase] += calls
+            self.__seconds[phase] += seconds
+
+    def snapshot(self) -> dict:
+        """Copy of the counters.
+
+        Returns:
+            A dict mapping every phase to a dict with the number of 'calls'
+            and the total 'seconds'
+
+        """
+        with self.__lock:
+            return {phase: {'calls': self.__calls[phase],
+                            'seconds': self.__seconds[phase]}
+                    for phase in self.phases}
+
+
+class _Matrices(object):
+    """Matrices of the same shape, bit-packed into one contiguous buffer.
+
+    The rows are stored like in the payload of the binary constants files:
+    (width + 7) // 8 bytes per row with the first column in the most
+    significant bit of the first byte, matrix after matrix. Indexing
+    unpacks the rows of one matrix into a tuple of integers (see gf2).
+    """
+
+    __slots__ = ['data', 'count', 'rows', 'width', 'row_bytes']
+
+    def __init__(self, data: bytes, count: int, rows: int,
+                 width: int) -> None:
+        self.data = data
+        self.count = count
+        self.rows = rows
+        self.width = width
+        self.row_bytes = (width + 7) // 8
+        assert (len(data) == count * rows * self.row_bytes), \
+            "Wrong size of the packed matrices"
+
+    @classmethod
+    def from_rows(cls, mats: tuple, width: int) -> '_Matrices':
+        row_bytes = (width + 7) // 8
+        padding = (8 * row_bytes) - width
+        data = b''.join((row << padding).to_bytes(row_bytes, 'big')
+                        for mat in mats for row in mat)
+        return cls(data, len(mats), len(mats[0]) if mats else 0, width)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, r: int) -> tuple:
+        if (not 0 <= r < self.count):
+            raise IndexError('matrix index out of range')
+        row_bytes = self.row_bytes
+        padding = (8 * row_bytes) - self.width
+        size = self.rows * row_bytes
+        data = self.data[r * size:(r + 1) * size]
+        from_bytes = int.from_bytes
+        return tuple([from_bytes(data[start:start + row_bytes], 'big')
+                      >> padding for start in range(0, size, row_bytes)])
+
+
+class _Constants(object):
+    """Read-only constants of one parameter set.
+
+    The matrices are kept bit-packed (see _Matrices), the round constants
+    as integers. The inverse linear layers are filled in on the first
+    decryption. Representations derived from the constants for a backend
+    (e.g. the integer rows of the linear layers or the Method of Four
+    Russians tables) are kept in `tables` under a name of their own.
+    """
+
+    __slots__ = ['lin_layer', 'lin_layer_inv', 'round_consts',
+                 'round_key_mats', 'digest', 'tables']
+
+    def __init__(self, lin_layer: _Matrices, round_consts: tuple,
+                 round_key_mats: _Matrices, digest: bytes) -> None:
+        self.lin_layer = lin_layer
+        self.lin_layer_inv = None
+        self.round_consts = round_consts
+        self.round_key_mats = round_key_mats
+        self.digest = digest
+        self.tables = {}
+
+
+def _evict_constants() -> None:
+    # The caller has to hold _constants_cache_lock
+    if (_constants_cache_maxsize is not None):
+        while (len(_constants_cache) > _constants_cache_maxsize):
+            _constants_cache.popitem(last=False)
+
+
+class Backend(object):
+    """Evaluation engine of LowMC, the base class of the BACKENDS.
+
+    A LowMC object creates an instance of its backend when it loads the
+    constants of its parameter set. The instance holds no key: LowMC passes
+    the round keys returned by expand_key to every call, so one instance
+    serves concurrent calls and key changes. Tables derived from the
+    constants belong into constants.tables (see get_table), where they are
+    shared by all LowMC objects of the parameter set.
+
+    Subclasses implement expand_key, encrypt and decrypt, which work on
+    integer states, and layers for the profiled round loop of LowMC.
+    prepare is called before the blocks of a direction are processed one
+    by one and builds the tables of the direction on first use. The NumPy
+    batch path of LowMC does not use the backend apart from its round keys.
+
+    Attributes:
+        description:    One line describing the backend
+        hoisted:        Whether the round keys include the round constants
+                        and are added to the sbox outputs before the linear
+                        layer (see HoistedBackend) instead of after it
+        batch:          Whether LowMC may use its NumPy batch path with the
+                        round keys of this backend
+        sliced_min_blocks:  The smallest batch for which LowMC uses its
+                        NumPy batch path if the parameter set has not been
+                        calibrated. Smaller batches are processed block by
+                        block. The batch path only beats the round loop of
+                        'int' from about 4 blocks on.
+    """
+
+    __slots__ = ['blocksize', 'keysize', 'number_sboxes', 'number_rounds',
+                 'constants', 'get_lin_layer_inv']
+
+    description = ''
+    hoisted = False
+    batch = True
+    sliced_min_blocks = 16
+
+    def __init__(self, params: tuple, constants: _Constants,
+                 get_lin_layer_inv: callable) -> None:
+        """Instanciates a backend for one parameter set.
+
+        Args:
+            params:             (name, blocksize, keysize, number_sboxes,
+                                number_rounds) as returned by parameter_set
+            constants:          The shared constants of the parameter set
+            get_lin_layer_inv:  Returns the packed inverse linear layers,
+                                which are read or computed on first use
+        """
+        (_, self.blocksize, self.keysize, self.number_sboxes,
+         self.number_rounds) = params
+        self.constants = constants
+        self.get_lin_layer_inv = get_lin_layer_inv
+
+    def get_table(self, name: str, build: callable) -> object:
+        """A table derived from the constants, built on first use.
+
+        Args:
+            name:   The name of the table in constants.tables, as reported
+                    by LowMC.table_sizes
+            build:  Returns the table, only called if it is not built yet
+
+        Returns:
+            The table shared by all LowMC objects of the parameter set
+
+        """
+        table = self.constants.tables.get(name)
+        if (table is None):
+            table = self.constants.tables.setdefault(name, build())
+        return table
+
+    def prepare(self, encrypt: bool) -> None:
+        """Build the tables of a direction on first use.
+
+        Args:
+            encrypt:    True for encryption, False for decryption
+        """
+
+    def wrap(self, state: int) -> object:
+        """An integer state in the representation of the round loop.
+
+        Args:
+            state:  The state as an integer, the first bit of the block in
+                    the most significant bit
+
+        Returns:
+            The state as used by layers, int() converts it back
+
+        """
+        return state
+
+    def expand_key(self, key: int) -> list:
+        """The round keys of a private key.
+
+        Args:
+            key:    The private key as an integer
+
+        Returns:
+            The number_rounds + 1 round keys in the representation of the
+            round loop, int() converts them to integers
+
+        """
+        raise NotImplementedError
+
+    def encrypt(self, round_keys: list, state: int) -> int:
+        """Encryption of an integer state.
+
+        Args:
+            round_keys: The round keys as returned by expand_key
+            state:      The plaintext as an integer
+
+        Returns:
+            The ciphertext as an integer
+
+        """
+        raise NotImplementedError
+
+    def decrypt(self, round_keys: list, state: int) -> int:
+        """Decryption of an integer state.
+
+        Args:
+            round_keys: The round keys as returned by expand_key
+            state:      The ciphertext as an integer
+
+        Returns:
+            The plaintext as an integer
+
+        """
+        raise NotImplementedError
+
+    def layers(self, encrypt: bool) -> tuple:
+        """The layers of a direction for the profiled round loop.
+
+        Args:
+            encrypt:    True for encryption, False for decryption
+
+        Returns:
+            A tuple (sbox, linear, round_consts) of the sbox layer
+            sbox(state), the linear layer linear(r, state) of round r and
+            the round constants, on states as returned by wrap
+
+        """
+        raise NotImplementedError
+
+
+class IntBackend(Backend):
+    """State, matrix rows, round constants and key as Python integers.
+
+    The subclasses change how the linear layers are multiplied (see
+    M4RMBackend) or where the round keys are added (see HoistedBackend).
+    """
+
+    __slots__ = ['shift', 'chunks', 'sbox_layer', 'sbox_layer_inv',
+                 'lin_layer', 'lin_layer_inv']
+
+    description = 'state, matrix rows, round constants and key as integers'
+
+    # Product of a linear layer in the representation of load_lin_layer
+    # with an integer
+    multiply = staticmethod(gf2.multiply_vec)
+
+    def __init__(self, params: tuple, constants: _Constants,
+                 get_lin_layer_inv: callable) -> None:
+        Backend.__init__(self, params, constants, get_lin_layer_inv)
+        self.shift = self.blocksize - (3 * self.number_sboxes)
+        self.chunks = (self.number_sboxes + 4) // 5
+        self.sbox_layer = None
+        self.sbox_layer_inv = None
+        self.lin_layer = None
+        self.lin_layer_inv = None
+
+    def load_lin_layer(self, suffix: str, mats: _Matrices) -> tuple:
+        # The rows of the (inverse) linear layers as integers
+        return self.get_table('rows' + suffix, lambda: tuple(mats))
+
+    def prepare(self, encrypt: bool) -> None:
+        # The linear layers are set last, they mark the direction as
+        # prepared for concurrent callers
+        if (encrypt):
+            if (self.lin_layer is None):
+                self.sbox_layer = _get_sbox_layer(SBOX)
+                self.lin_layer = self.load_lin_layer(
+                    '', self.constants.lin_layer)
+        elif (self.lin_layer_inv is None):
+            self.sbox_layer_inv = _get_sbox_layer(SBOX_INV)
+            self.lin_layer_inv = self.load_lin_layer(
+                '_inv', self.get_lin_layer_inv())
+
+    def expand_key(self, key: int) -> list:
+        key_mats = self.get_table(
+            'rows_key', lambda: tuple(self.constants.round_key_mats))
+        return [gf2.multiply_vec(mat, key) for mat in key_mats]
+
+    def encrypt(self, round_keys: list, state: int) -> int:
+        lin_layer = self.lin_layer
+        round_consts = self.constants.round_consts
+        multiply = self.multiply
+        table, shift, chunks = self.sbox_layer, self.shift, self.chunks
+
+        state ^= round_keys[0]
+
+        for i in range(self.number_rounds):
+            state = _substitute(state, table, shift, chunks)
+            state = multiply(lin_layer[i], state)
+            state ^= round_consts[i]
+            state ^= round_keys[i + 1]
+
+        return state
+
+    def decrypt(self, round_keys: list, state: int) -> int:
+        lin_layer_inv = self.lin_layer_inv
+        round_consts = self.constants.round_consts
+        multiply = self.multiply
+        table, shift, chunks = self.sbox_layer_inv, self.shift, self.chunks
+
+        for i in range(self.number_rounds, 0, -1):
+            state ^= round_keys[i]
+            state ^= round_consts[i - 1]
+            state = multiply(lin_layer_inv[i - 1], state)
+            state = _substitute(state, table, shift, chunks)
+
+        state ^= round_keys[0]
+
+        return state
+
+    def layers(self, encrypt: bool) -> tuple:
+        if (encrypt):
+            table, mats = self.sbox_layer, self.lin_layer
+        else:
+            table, mats = self.sbox_layer_inv, self.lin_layer_inv
+        shift, chunks, multiply = self.shift, self.chunks, self.multiply
+        return (lambda state: _substitute(state, table, shift, chunks),
+                lambda r, state: multiply(mats[r], state),
+                self.constants.round_consts)
+
+
+class HoistedBackend(IntBackend):
+    """The integer backend with the round keys hoisted out of the rounds.
+
+    The round keys and constants are pushed through the linear layers, so
+    only the sbox bits get a key addition per round and the key setup is
+    cheaper.
+    """
+
+    __slots__ = []
+
+    description = 'integers, round keys pushed through the linear layers'
+    hoisted = True
+
+    def expand_key(self, key: int) -> list:
+        # The matrices act on the key with a constant 1 appended
+        key = (key << 1) | 1
+        first_mat, round_mats = self.get_table('hoisted',
+                                               self.__build_round_key_mats)
+        round_keys = [gf2.multiply_vec(first_mat, key)]
+        round_keys.extend(gf2.multiply_vec(mat, key) << self.shift
+                          for mat in round_mats)
+        return round_keys
+
+    def encrypt(self, round_keys: list, state: int) -> int:
+        lin_layer = self.lin_layer
+        table, shift, chunks = self.sbox_layer, self.shift, self.chunks
+
+        state ^= round_keys[0]
+
+        for i in range(self.number_rounds):
+            state = _substitute(state, table, shift, chunks)
+            state ^= round_keys[i + 1]
+            state = gf2.multiply_vec(lin_layer[i], state)
+
+        return state
+
+    def decrypt(self, round_keys: list, state: int) -> int:
+        lin_layer_inv = self.lin_layer_inv
+        table, shift, chunks = self.sbox_layer_inv, self.shift, self.chunks
+
+        for i in range(self.number_rounds, 0, -1):
+            state = gf2.multiply_vec(lin_layer_inv[i - 1], state)
+            state ^= round_keys[i]
+            state = _substitute(state, table, shift, chunks)
+
+        state ^= round_keys[0]
+
+        return state
+
+    def __build_round_key_mats(self) -> tuple:
+        # Round key hoisting as in the optimized Picnic implementation:
+        # the addition of c_i + K_(i+1) * key after the linear layer L_i
+        # equals the addition of L_i^-1 * (c_i + K_(i+1) * key) before it.
+        # Only the sbox bits of that addend have to stay after the sboxes
+        # of round i, the remaining bits pass the sboxes unchanged and move
+        # on into round i - 1, and finally into the first key addition.
+        # The affine maps are kept as matrices on the key with a constant 1
+        # appended, i.e. the round constant is the last column. Returns
+        # the matrix of the first key addition and the (3 * number_sboxes
+        # rows) matrices of the per round key additions. L_i^-1 times the
+        # addend is solved for with the forward matrix L_i, so an object
+        # that only encrypts never inverts the linear layers.
+
+        # Unpacked one matrix at a time
+        lin_layer = self.constants.lin_layer
+        round_key_mats = self.constants.round_key_mats
+        round_consts = self.constants.round_consts
+        n = self.blocksize
+        sbox_bits = 3 * self.number_sboxes
+        carry = [0] * n
+        round_mats = []
+        for r in range(self.number_rounds - 1, -1, -1):
+            const = round_consts[r]
+            addend = [((row << 1) | ((const >> (n - 1 - i)) & 1)) ^ carry[i]
+                      for i, row in enumerate(round_key_mats[r + 1])]
+            addend = gf2.solve(lin_layer[r], addend, self.keysize + 1)
+            round_mats.append(tuple(addend[:sbox_bits]))
+            carry = [0] * sbox_bits + list(addend[sbox_bits:])
+        round_mats.reverse()
+
+        first_mat = tuple((row << 1) ^ carry[i]
+                          for i, row in enumerate(round_key_mats[0]))
+        return (first_mat, tuple(round_mats))
+
+
+class M4RMBackend(IntBackend):
+    """The integer backend with the matrices as Method of Four Russians
+    tables, one lookup per input byte."""
+
+    __slots__ = []
+
+    description = 'integers, matrices as Method of Four Russians tables'
+    # A single block is about 10 times faster than with 'int'
+    sliced_min_blocks = 64
+
+    multiply = staticmethod(_multiply_m4rm)
+
+    def load_lin_layer(self, suffix: str, mats: _Matrices) -> tuple:
+        # The key setup uses the integer rows of the round key matrices,
+        # tables for them would cost as much memory as for the linear
+        # layers to save a fraction of a millisecond per key
+        return self.get_table('m4rm' + suffix, lambda: tuple(
+            _build_m4rm_tables(mat, self.blocksize) for mat in mats))
+
+
+class BitVectorBackend(Backend):
+    """The original implementation on BitVector."""
+
+    __slots__ = ['lin_layer', 'lin_layer_inv', 'round_consts']
+
+    description = 'the original implementation on BitVector'
+    batch = False
+
+    def __init__(self, params: tuple, constants: _Constants,
+                 get_lin_layer_inv: callable) -> None:
+        Backend.__init__(self, params, constants, get_lin_layer_inv)
+        self.lin_layer = None
+        self.lin_layer_inv = None
+        self.round_consts = self.get_table(
+            'bitvector_consts', lambda: tuple(
+                BitVector(intVal=const, size=self.blocksize)
+                for const in constants.round_consts))
+
+    def prepare(self, encrypt: bool) -> None:
+        if (encrypt):
+            if (self.lin_layer is None):
+                self.lin_layer = self.get_table(
+                    'bitvector',
+                    lambda: self.__rows(self.constants.lin_layer))
+        elif (self.lin_layer_inv is None):
+            self.lin_layer_inv = self.get_table(
+                'bitvector_inv',
+                lambda: self.__rows(self.get_lin_layer_inv()))
+
+    @staticmethod
+    def __rows(mats: _Matrices) -> tuple:
+        return tuple(tuple(BitVector(intVal=row, size=mats.width)
+                           for row in mat) for mat in mats)
+
+    def wrap(self, state: int) -> BitVector:
+        return BitVector(intVal=state, size=self.blocksize)
+
+    def expand_key(self, key: int) -> list:
+        key_mats = self.get_table(
+            'bitvector_key',
+            lambda: self.__rows(self.constants.round_key_mats))
+        priv_key = BitVector(intVal=key, size=self.keysize)
+        round_keys = []
+        for mat in key_mats:
+            round_key = BitVector(size=self.blocksize)
+            for i, row in enumerate(mat):
+                round_key[i] = (row & priv_key).count_bits() % 2
+            round_keys.append(round_key)
+        return round_keys
+
+    def encrypt(self, round_keys: list, state: int) -> int:
+        state = self.wrap(state) ^ round_keys[0]
+
+        for i in range(self.number_rounds):
+            state = self.apply_sbox(state)
+            state = self.multiply_with_lin_mat(self.lin_layer[i], state)
+            state = state ^ self.round_consts[i]
+            state = state ^ round_keys[i + 1]
+
+        return int(state)
+
+    def decrypt(self, round_keys: list, state: int) -> int:
+        state = self.wrap(state)
+
+        for i in range(self.number_rounds, 0, -1):
+            state = state ^ round_keys[i]
+            state = state ^ self.round_consts[i - 1]
+            state = self.multiply_with_lin_mat(self.lin_layer_inv[i - 1],
+                                               state)
+            state = self.apply_sbox_inv(state)
+
+        return int(state ^ round_keys[0])
+
+    def layers(self, encrypt: bool) -> tuple:
+        if (encrypt):
+            sbox, mats = self.apply_sbox, self.lin_layer
+        else:
+            sbox, mats = self.apply_sbox_inv, self.lin_layer_inv
+        return (sbox, lambda r, state: self.multiply_with_lin_mat(mats[r],
+                                                                  state),
+                self.round_consts)
+
+    def apply_sbox(self, state: BitVector) -> BitVector:
+        result = BitVector(size=self.blocksize)
+        state_copy = state.deep_copy()
+
+        # Copy the identity part of the message
+        result_ident = state_copy[(3 * self.number_sboxes):self.blocksize]
+
+        # Substitute the rest of the message with the sboxes
+        # ----------------------------------------------------
+        # ATTENTION: The 3-bit chunks seem to be reversed
+        # in the Picnic-Ref-Implementation, compared to the
+        # LowMC-Ref-Implementation and the original LowMC-paper.
+        # Example: state[0:3]='001' becomes '100' then gets sboxed
+        # to '111' and reversed again for the state-update.
+        # ----------------------------------------------------
+        state_copy = state[0:(3 * self.number_sboxes)]
+        result_sbox = BitVector(size=0)
+        for i in range(self.number_sboxes):
+            state_index = (3 * i)
+            state_3_bits = state_copy[state_index:state_index + 3].reverse()
+            sbox_3_bits = BitVector(intVal=SBOX[int(state_3_bits)],
+                                    size=3).reverse()
+            result_sbox = result_sbox + sbox_3_bits
+
+        result = result_sbox + result_ident
+        return result
+
+    def apply_sbox_inv(self, state: BitVector) -> BitVector:
+        result = BitVector(size=self.blocksize)
+        state_copy = state.deep_copy()
+
+        # Copy the identity part of the message
+        result_ident = state_copy[(3 * self.number_sboxes):self.blocksize]
+
+        # Substitute the rest of the message with the inverse sboxes
+        # ----------------------------------------------------
+        # ATTENTION: The 3-bit chunks seem to be reversed
+        # in the Picnic-Ref-Implementation, compared to the
+        # LowMC-Ref-Implementation and the original LowMC-paper.
+        # ----------------------------------------------------
+        state_copy = state[0:(3 * self.number_sboxes)]
+        result_sbox = BitVector(size=0)
+        for i in range(self.number_sboxes):
+            state_index = (3 * i)
+            state_3_bits = state_copy[state_index:state_index + 3].reverse()
+            sbox_3_bits = BitVector(intVal=SBOX_INV[int(state_3_bits)],
+                                    size=3).reverse()
+            result_sbox = result_sbox + sbox_3_bits
+
+        result = result_sbox + result_ident
+        return result
+
+    def multiply_with_lin_mat(self, mat: tuple,
+                              state: BitVector) -> BitVector:
+        result = BitVector(size=self.blocksize)
+        for i in range(self.blocksize):
+            result[i] = (mat[i] & state).count_bits() % 2
+        return result
+
+
+# Registry of the evaluation backends, see LowMC.__init__ and Backend.
+# LowMC.backends lists them in this order and LowMC.calibrate times all
+# of them.
+BACKENDS = OrderedDict([
+    ('int', IntBackend),
+    ('hoisted', HoistedBackend),
+    ('m4rm', M4RMBackend),
+    ('bitvector', BitVectorBackend),
+])
+
+
+def register_backend(name: str, backend: type) -> None:
+    """Add an evaluation backend or replace one.
+
+    The backend can be selected by name from then on, and LowMC.calibrate
+    times it along with the others.
+
+    Args:
+        name:       The name of the backend, e.g. for LowMC(param, name)
+        backend:    A subclass of Backend
+    """
+    assert issubclass(backend, Backend), "Backend is no subclass of Backend"
+    BACKENDS[name] = backend
+    LowMC.backends = tuple(BACKENDS)
+
 
 class LowMC(object):
     """LowMC blockcipher mainclass.
@@ -19,54 +937,80 @@ class LowMC(object):
 
     __slots__ = ['__blocksize', '__keysize', '__number_sboxes',
                  '__number_rounds', '__filename', '__blocksize_bytes',
-                 '__keysize_bytes', '__plaintext', '__priv_key', '__state',
-                 '__lin_layer', '__lin_layer_inv', '__round_consts',
-                 '__round_key_mats', '__sbox', '__sbox_inv']
+                 '__keysize_bytes', '__priv_key', '__backend', '__engine',
+                 '__round_keys', '__constants', '__param', '__stats',
+                 '__padding', '__key_padding', '__sliced_min_blocks']
+
+    backends = tuple(BACKENDS)
+
+    # Number of blocks processed together by the NumPy batch path. Bounds
+    # the size of the temporary tables to a few MB for L5.
+    batch_chunk = 8192
 
-    def __init__(self, param: str) -> None:
+    def __init__(self, param: Union[str, tuple],
+                 backend: Optional[str] = None,
+                 stats: Optional[LowMCStats] = None) -> None:
         """Instanciates a LowMC object.
 
+        The constants files are not read here but on first use, usually
+        when the private key is set. They are looked up next to this module
+        and, for parameter sets without packaged files, in the current
+        working directory.
+
+        The batch calls only use the NumPy batch path for batches at least
+        as large as the calibrated size for the backend (see
+        LowMC.calibrate) or, if the parameter set has not been calibrated,
+        the default of the backend (Backend.sliced_min_blocks).
+
         Args:
-            param:  A string containing the Picnic security level
+            param:      The name of a parameter set in PARAMETER_SETS
+                        (e.g. 'picnic-L1' or 'picnic3-L1') or a tuple
+                        (blocksize, keysize, number_sboxes, number_rounds).
+                        Blocks and keys whose size is not a multiple of 8
+                        are passed as bytes with zero padding bits at the
+                        end, like in Picnic.
+            backend:    The evaluation engine, one of LowMC.backends (see
+                        BACKENDS and register_backend). By default the
+                        fastest backend of the calibration, or 'int'
+                        without a calibration. 'int' keeps the state, the
+                        matrix rows, the round constants and the key as
+                        Python integers, 'hoisted' is the integer backend
+                        with the round keys and constants pushed through
+                        the linear layers (only the sbox bits get a key
+                        addition per round), 'm4rm' is the integer backend
+                        with the matrices as Method of Four Russians
+                        tables (one lookup per input byte), 'bitvector' is
+                        the original BitVector based implementation.
+            stats:      If provided, a LowMCStats object recording the
+                        time spent in every phase of this object
         """
-        if (param == 'picnic-L1'):
-            self.__blocksize = 128
-            self.__keysize = 128
-            self.__number_sboxes = 10
-            self.__number_rounds = 20
-            self.__filename = 'picnic-L1.dat'
-        elif (param == 'picnic-L3'):
-            self.__blocksize = 192
-            self.__keysize = 192
-            self.__number_sboxes = 10
-            self.__number_rounds = 30
-            self.__filename = 'picnic-L3.dat'
-        elif (param == 'picnic-L5'):
-            self.__blocksize = 256
-            self.__keysize = 256
-            self.__number_sboxes = 10
-            self.__number_rounds = 38
-            self.__filename = 'picnic-L5.dat'
-        else:
-            raise Exception('Argument is not a valid Picnic security Level: {}'
-                            .format(param))
+        (self.__filename, self.__blocksize, self.__keysize,
+         self.__number_sboxes, self.__number_rounds) = parameter_set(param)
 
-        self.__blocksize_bytes = int(self.__blocksize / 8)
-        self.__keysize_bytes = int(self.__keysize / 8)
+        calibration = _get_calibration(self.__filename)
+        if (backend is None):
+            backend = calibration.get('backend')
+            if (backend not in BACKENDS):
+                backend = 'int'
+        if (backend not in BACKENDS):
+            raise Exception('Argument is not a valid LowMC backend: {}'
+                            .format(backend))
+        self.__sliced_min_blocks = calibration.get(
+            'sliced_min_blocks', {}).get(
+                backend, BACKENDS[backend].sliced_min_blocks)
+        self.__backend = backend
+        self.__param = param
+        self.__stats = stats
 
-        self.__plaintext = None
+        self.__blocksize_bytes = (self.__blocksize + 7) // 8
+        self.__keysize_bytes = (self.__keysize + 7) // 8
+        self.__padding = (8 * self.__blocksize_bytes) - self.__blocksize
+        self.__key_padding = (8 * self.__keysize_bytes) - self.__keysize
 
         self.__priv_key = None
-        self.__state = None
-        self.__lin_layer = []
-        self.__lin_layer_inv = []
-        self.__round_consts = []
-        self.__round_key_mats = []
-        self.__sbox = [0x00, 0x01, 0x03, 0x06, 0x07, 0x04, 0x05, 0x02]
-        self.__sbox_inv = [0x00, 0x01, 0x07, 0x02, 0x05, 0x06, 0x03, 0x04]
-
-        self.__read_constants()
-        self.__invert_lin_matrix()
+        self.__round_keys = None
+        self.__constants = None
+        self.__engine = None
 
     @property
     def private_key(self) -> bytes:
@@ -87,18 +1031,131 @@ class LowMC(object):
         If no private key is provided as argument, one is generated from the
         CSPRNG of the underlying OS. This should be a plattform independend
         source for randomness. It will have the length self.__keysize_bytes.
+        All round keys are expanded here once, so en- and decryption only
+        have to XOR them into the state.
 
         Args:
             priv_key:   If provided, must be a bytearray of
                         length self.__keysize_bytes
         """
         if (priv_key is None):
-            temp_key = os.urandom(int(self.__keysize_bytes))
-            self.__priv_key = BitVector(rawbytes=temp_key)
+            priv_key = os.urandom(int(self.__keysize_bytes))
         else:
             assert (len(priv_key) == self.__keysize_bytes), \
                     "Private key has length != keysize"
-            self.__priv_key = BitVector(rawbytes=priv_key)
+        priv_key = BitVector(
+            intVal=int.from_bytes(priv_key, 'big') >> self.__key_padding,
+            size=self.__keysize)
+        self.__load_constants()
+
+        # Expanded first and swapped in at once, a concurrent en- or
+        # decryption reads the round keys only once per block
+        self.__round_keys = self.__engine.expand_key(int(priv_key))
+        self.__priv_key = priv_key
+
+    @property
+    def param(self) -> Union[str, tuple]:
+        """The parameter set this object was created with."""
+        return self.__param
+
+    @property
+    def backend(self) -> str:
+        """Name of the evaluation engine used by this object."""
+        return self.__backend
+
+    @property
+    def stats(self) -> Optional[LowMCStats]:
+        """The LowMCStats object recording this object, or None."""
+        return self.__stats
+
+    @stats.setter
+    def stats(self, stats: Optional[LowMCStats]) -> None:
+        self.__stats = stats
+
+    @property
+    def blocksize(self) -> int:
+        """Length of a block in bits."""
+        return self.__blocksize
+
+    @property
+    def keysize(self) -> int:
+        """Length of the private key in bits."""
+        return self.__keysize
+
+    @property
+    def blocksize_bytes(self) -> int:
+        """Length of a plain- or ciphertext block in bytes."""
+        return self.__blocksize_bytes
+
+    @property
+    def keysize_bytes(self) -> int:
+        """Length of the private key in bytes."""
+        return self.__keysize_bytes
+
+    @property
+    def tape_bytes(self) -> int:
+        """Length of a random tape and a view of simulate_mpc in bytes."""
+        return (3 * self.__number_sboxes * self.__number_rounds + 7) // 8
+
+    def table_sizes(self) -> dict:
+        """Memory held by the precomputed tables of this parameter set.
+
+        The tables are built on first use and shared by all LowMC objects of
+        the same parameter set, every backend only builds the ones it uses.
+
+        Returns:
+            A dict mapping the names of the tables built so far (e.g. 'rows',
+            'rows_inv', 'rows_key', 'm4rm', 'm4rm_inv', 'hoisted',
+            'bitvector' or 'bitvector_key') to their size in bytes
+
+        """
+        self.__load_constants()
+        return {name: self.__deep_sizeof(table)
+                for name, table in self.__constants.tables.items()}
+
+    def memory_footprint(self) -> dict:
+        """Memory held by this object and by the constants it shares.
+
+        The matrices of a parameter set are stored bit-packed, one buffer
+        per matrix set, and shared by all LowMC objects of the parameter
+        set. So are the tables derived from them (see table_sizes) and the
+        sbox tables of the integer backends, which are shared by all
+        parameter sets. The backend object of this object only references
+        them. The block by block round loops of the integer backends do not
+        run on the packed buffers: they keep a second copy of the matrices
+        they use as tuples of integers ('rows', 'rows_inv' and 'rows_key'),
+        two to three times the size of the packed buffers. Only the NumPy
+        batch path works on the packed buffers alone.
+
+        Returns:
+            A dict with the bytes held by 'instance' (this object with its
+            key and round keys), by 'constants' (a dict with the sizes of
+            'lin_layer', 'lin_layer_inv', 'round_consts', 'round_key_mats'
+            and of the 'tables' as returned by table_sizes), by the shared
+            'sbox_layers' and the 'total' of all of them
+
+        """
+        self.__load_constants()
+        constants = self.__constants
+        instance = sys.getsizeof(self) + sum(
+            self.__deep_sizeof(value) for value in (
+                self.__priv_key, self.__round_keys, self.__engine))
+        tables = self.table_sizes()
+        shared = {
+            'lin_layer': self.__deep_sizeof(constants.lin_layer),
+            'lin_layer_inv': 0 if (constants.lin_layer_inv is None)
+            else self.__deep_sizeof(constants.lin_layer_inv),
+            'round_consts': self.__deep_sizeof(constants.round_consts),
+            'round_key_mats': self.__deep_sizeof(constants.round_key_mats),
+            'tables': tables}
+        with _sbox_layers_lock:
+            sbox_layers = sum(self.__deep_sizeof(table)
+                              for table in _sbox_layers.values())
+        return {'instance': instance, 'constants': shared,
+                'sbox_layers': sbox_layers,
+                'total': instance + sbox_layers + sum(tables.values())
+                + sum(size for name, size in shared.items()
+                      if name != 'tables')}
 
     def encrypt(self, plaintext: bytes) -> bytes:
         """Encryption of a plaintext.
@@ -115,19 +1172,8 @@ class LowMC(object):
             "Plaintext has length != blocksize"
         assert (self.__priv_key is not None), "Private key not set"
 
-        self.__state = BitVector(rawbytes=plaintext)
-
-        self.__key_addition(0)
-
-        for i in range(self.__number_rounds):
-            self.__apply_sbox()
-            self.__multiply_with_lin_mat(i)
-            self.__state = self.__state ^ self.__round_consts[i]
-            self.__key_addition(i + 1)
-
-        result = bytes.fromhex(self.__state.get_bitvector_in_hex())
-        self.__state = None
-        return result
+        return self.__from_state(
+            self.__encrypt_state(self.__to_state(plaintext)))
 
     def decrypt(self, ciphertext: bytes) -> bytes:
         """Decryption of a ciphertext.
@@ -143,98 +1189,1197 @@ class LowMC(object):
             "Ciphertext has length != blocksize"
         assert (self.__priv_key is not None), "Private key not set"
 
-        self.__state = BitVector(rawbytes=ciphertext)
+        return self.__from_state(
+            self.__decrypt_state(self.__to_state(ciphertext)))
 
-        for i in range(self.__number_rounds, 0, -1):
-            self.__key_addition(i)
-            self.__state = self.__state ^ self.__round_consts[i - 1]
-            self.__multiply_with_lin_mat_inv(i - 1)
-            self.__apply_sbox_inv()
+    def encrypt_many(self, blocks: Union[list, bytes]) -> Union[list, bytes]:
+        """Encryption of many plaintexts at once.
 
-        self.__key_addition(0)
+        With NumPy installed the blocks are bitsliced and processed together,
+        otherwise (and for backends without batch support like 'bitvector')
+        block by block.
+
+        Args:
+            blocks:     Either a list of bytearrays of length
+                        self.__blocksize_bytes or a single buffer holding
+                        the plaintexts back to back
+
+        Returns:
+            A list of ciphertexts (bytes) if a list was given, otherwise
+            bytes holding the ciphertexts back to back
 
-        result = bytes.fromhex(self.__state.get_bitvector_in_hex())
-        self.__state = None
+        """
+        return self.__process_many(blocks, True)
+
+    def decrypt_many(self, blocks: Union[list, bytes]) -> Union[list, bytes]:
+        """Decryption of many ciphertexts at once.
+
+        Args:
+            blocks:     Either a list of bytearrays of length
+                        self.__blocksize_bytes or a single buffer holding
+                        the ciphertexts back to back
+
+        Returns:
+            A list of plaintexts (bytes) if a list was given, otherwise
+            bytes holding the plaintexts back to back
+
+        """
+        return self.__process_many(blocks, False)
+
+    def __process_many(self, blocks: Union[list, bytes],
+                       encrypt: bool) -> Union[list, bytes]:
+        assert (self.__priv_key is not None), "Private key not set"
+
+        size = self.__blocksize_bytes
+        is_list = isinstance(blocks, (list, tuple))
+        if (is_list):
+            for block in blocks:
+                assert (len(block) == size), "Block has length != blocksize"
+            data = b''.join(blocks)
+        else:
+            data = memoryview(blocks).cast('B')
+            assert (len(data) % size == 0), \
+                "Buffer length is not a multiple of blocksize"
+
+        result = bytearray(len(data))
+        self.__process_ecb(data, memoryview(result), encrypt)
+        result = bytes(result)
+
+        if (is_list):
+            return [result[i:i + size] for i in range(0, len(result), size)]
         return result
 
-    def __apply_sbox(self) -> None:
-        result = BitVector(size=self.__blocksize)
-        state_copy = self.__state.deep_copy()
+    def encrypt_many_keys(self, keys: Union[list, bytes],
+                          plaintexts: Union[list, bytes]
+                          ) -> Union[list, bytes]:
+        """Encryption under many keys at once.
 
-        # Copy the identity part of the message
-        result_ident = state_copy[(3 * self.__number_sboxes):self.__blocksize]
+        The private key of this object is not used. With NumPy, the keys and
+        blocks are bitsliced, all round keys are computed as one matrix
+        product over the whole key batch and the rounds run on all keys at
+        once. Without NumPy, with the bitvector backend or for fewer keys
+        than the batch path needs (see LowMC.__init__), the backend sets up
+        the keys and encrypts key by key.
 
-        # Substitute the rest of the message with the sboxes
-        # ----------------------------------------------------
-        # ATTENTION: The 3-bit chunks seem to be reversed
-        # in the Picnic-Ref-Implementation, compared to the
-        # LowMC-Ref-Implementation and the original LowMC-paper.
-        # Example: state[0:3]='001' becomes '100' then gets sboxed
-        # to '111' and reversed again for the state-update.
-        # ----------------------------------------------------
-        state_copy = self.__state[0:(3 * self.__number_sboxes)]
-        result_sbox = BitVector(size=0)
-        for i in range(self.__number_sboxes):
-            state_index = (3 * i)
-            state_3_bits = state_copy[state_index:state_index + 3].reverse()
-            sbox_3_bits = BitVector(intVal=self.__sbox[int(state_3_bits)],
-                                    size=3).reverse()
-            result_sbox = result_sbox + sbox_3_bits
+        Args:
+            keys:       Either a list of N bytearrays of length
+                        self.__keysize_bytes or a single buffer holding
+                        the keys back to back
+            plaintexts: Either a list of N bytearrays of length
+                        self.__blocksize_bytes, a single buffer holding the
+                        N plaintexts back to back, or a single plaintext
+                        which is encrypted under all keys
 
-        result = result_sbox + result_ident
-        self.__state = result
+        Returns:
+            A list of the N ciphertexts (bytes) if the keys were given as a
+            list, otherwise bytes holding the ciphertexts back to back
 
-    def __apply_sbox_inv(self) -> None:
-        result = BitVector(size=self.__blocksize)
-        state_copy = self.__state.deep_copy()
+        """
+        size = self.__blocksize_bytes
+        key_size = self.__keysize_bytes
+        is_list = isinstance(keys, (list, tuple))
+        if (is_list):
+            for key in keys:
+                assert (len(key) == key_size), \
+                    "Private key has length != keysize"
+            key_data = b''.join(keys)
+        else:
+            key_data = bytes(memoryview(keys).cast('B'))
+            assert (len(key_data) % key_size == 0), \
+                "Buffer length is not a multiple of keysize"
+        number_keys = len(key_data) // key_size
 
-        # Copy the identity part of the message
-        result_ident = state_copy[(3 * self.__number_sboxes):self.__blocksize]
+        if (isinstance(plaintexts, (list, tuple))):
+            for block in plaintexts:
+                assert (len(block) == size), "Block has length != blocksize"
+            data = b''.join(plaintexts)
+        else:
+            data = bytes(memoryview(plaintexts).cast('B'))
+        assert (len(data) in (size, number_keys * size)), \
+            "Number of plaintexts is neither 1 nor the number of keys"
 
-        # Substitute the rest of the message with the inverse sboxes
-        # ----------------------------------------------------
-        # ATTENTION: The 3-bit chunks seem to be reversed
-        # in the Picnic-Ref-Implementation, compared to the
-        # LowMC-Ref-Implementation and the original LowMC-paper.
-        # ----------------------------------------------------
-        state_copy = self.__state[0:(3 * self.__number_sboxes)]
-        result_sbox = BitVector(size=0)
-        for i in range(self.__number_sboxes):
-            state_index = (3 * i)
-            state_3_bits = state_copy[state_index:state_index + 3].reverse()
-            sbox_3_bits = BitVector(intVal=self.__sbox_inv[int(state_3_bits)],
-                                    size=3).reverse()
-            result_sbox = result_sbox + sbox_3_bits
+        self.__load_constants()
+        start = time.perf_counter()
+        result = bytearray(number_keys * size)
+        if ((_import_numpy() is not None) and self.__engine.batch
+                and (self.__sliced_min_blocks is not None)
+                and (number_keys >= self.__sliced_min_blocks)):
+            for first in range(0, number_keys, self.batch_chunk):
+                last = min(first + self.batch_chunk, number_keys)
+                keys_chunk = np.frombuffer(
+                    key_data[first * key_size:last * key_size],
+                    dtype=np.uint8).reshape(-1, key_size)
+                if (len(data) == size):
+                    blocks = data
+                else:
+                    blocks = data[first * size:last * size]
+                blocks = np.frombuffer(blocks, dtype=np.uint8) \
+                    .reshape(-1, size)
+                result[first * size:last * size] = \
+                    self.__encrypt_sliced_keys(keys_chunk, blocks).tobytes()
+        else:
+            engine = self.__engine
+            engine.prepare(True)
+            for k in range(number_keys):
+                key = int.from_bytes(key_data[k * key_size:(k + 1)
+                                              * key_size], 'big') \
+                    >> self.__key_padding
+                block = data if (len(data) == size) \
+                    else data[k * size:(k + 1) * size]
+                state = engine.encrypt(engine.expand_key(key),
+                                       self.__to_state(block))
+                result[k * size:(k + 1) * size] = self.__from_state(state)
+        self.__record('encrypt', start, number_keys)
 
-        result = result_sbox + result_ident
-        self.__state = result
-
-    def __multiply_with_lin_mat(self, r: int) -> None:
-        result = BitVector(size=self.__blocksize)
-        for i in range(self.__blocksize):
-            result[i] = (self.__lin_layer[r][i] & self.__state) \
-                .count_bits() % 2
-        self.__state = result
-
-    def __multiply_with_lin_mat_inv(self, r: int) -> None:
-        result = BitVector(size=self.__blocksize)
-        for i in range(self.__blocksize):
-            result[i] = (self.__lin_layer_inv[r][i] & self.__state) \
-                        .count_bits() % 2
-        self.__state = result
-
-    def __key_addition(self, r: int) -> None:
-        round_key = BitVector(size=self.__keysize)
-        for i in range(self.__blocksize):
-            round_key[i] = (self.__round_key_mats[r][i] & self.__priv_key) \
-                            .count_bits() % 2
-        self.__state = self.__state ^ round_key
-
-    def __read_constants(self) -> None:
-        with open(self.__filename, 'r') as matfile:
+        result = bytes(result)
+        if (is_list):
+            return [result[i:i + size] for i in range(0, len(result), size)]
+        return result
+
+    def simulate_mpc(self, key_shares: list, plaintexts: Union[list, bytes],
+                     tapes: list) -> tuple:
+        """Simulation of the three party evaluation of Picnic (ZKBoo).
+
+        LowMC is evaluated on XOR shares of the key for many repetitions at
+        once, like by the prover of Picnic. The round keys and the linear
+        layers are applied share by share, plaintext and round constants
+        are added to the share of the first party. For every AND gate of
+        the sboxes, party p computes its output share from the input shares
+        of the parties p and p + 1 and the next bit of both of their random
+        tapes. These output shares are the view of the party. The private
+        key of this object is not used. With NumPy, the repetitions are
+        bitsliced and simulated together, otherwise one by one.
+
+        Args:
+            key_shares: The key shares of the three parties, for every
+                        party either a list of N bytearrays of length
+                        self.__keysize_bytes or a single buffer holding them
+                        back to back. The key of a repetition is the XOR
+                        of its three shares.
+            plaintexts: Either N plaintexts (as a list or a buffer) or a
+                        single plaintext for all repetitions
+            tapes:      The random tapes of the three parties, for every
+                        party N tapes of length self.tape_bytes as a list
+                        or a buffer. Bit j (the most significant bit first)
+                        is used by AND gate j, the gates are ordered by
+                        round, by sbox and as a*b, b*c, c*a within an sbox.
+
+        Returns:
+            A tuple (views, outputs), where views[p] holds the N views of
+            party p (its AND gate outputs in the order of the tape bits)
+            and outputs[p] its N output shares. The XOR of the three output
+            shares of a repetition is the ciphertext. Lists if the key
+            shares were given as lists, otherwise buffers holding them back
+            to back.
+
+        """
+        assert (len(key_shares) == 3) and (len(tapes) == 3), \
+            "Key shares and tapes are needed for three parties"
+        size = self.__blocksize_bytes
+        key_size = self.__keysize_bytes
+        tape_size = self.tape_bytes
+        tape_padding = 8 * tape_size \
+            - 3 * self.__number_sboxes * self.__number_rounds
+        is_list = isinstance(key_shares[0], (list, tuple))
+
+        key_data = [self.__join(shares, key_size) for shares in key_shares]
+        tape_data = [self.__join(tape, tape_size) for tape in tapes]
+        data = self.__join(plaintexts, size)
+        number = len(key_data[0]) // key_size
+        for shares in key_data:
+            assert (len(shares) == number * key_size), \
+                "Number of key shares differs between the parties"
+        for tape in tape_data:
+            assert (len(tape) == number * tape_size), \
+                "Number of tapes is not the number of key shares"
+        assert (len(data) in (size, number * size)), \
+            "Number of plaintexts is neither 1 nor the number of key shares"
+
+        self.__load_constants()
+        views = [bytearray(number * tape_size) for _ in range(3)]
+        outputs = [bytearray(number * size) for _ in range(3)]
+        if ((_import_numpy() is not None) and self.__engine.batch):
+            for first in range(0, number, self.batch_chunk):
+                last = min(first + self.batch_chunk, number)
+
+                def rows(buffer: bytes, length: int) -> 'np.ndarray':
+                    return np.frombuffer(
+                        buffer[first * length:last * length],
+                        dtype=np.uint8).reshape(-1, length)
+
+                blocks = np.frombuffer(data, dtype=np.uint8) \
+                    .reshape(-1, size)
+                if (len(data) != size):
+                    blocks = rows(data, size)
+                view, output = self.__simulate_sliced(
+                    [rows(shares, key_size) for shares in key_data],
+                    blocks, [rows(tape, tape_size) for tape in tape_data])
+                for p in range(3):
+                    views[p][first * tape_size:last * tape_size] = \
+                        view[p].tobytes()
+                    outputs[p][first * size:last * size] = \
+                        output[p].tobytes()
+        else:
+            mats = (tuple(self.__constants.lin_layer),
+                    tuple(self.__constants.round_key_mats))
+            for k in range(number):
+                keys = [int.from_bytes(shares[k * key_size:(k + 1)
+                                              * key_size], 'big')
+                        >> self.__key_padding for shares in key_data]
+                rand = [int.from_bytes(tape[k * tape_size:(k + 1)
+                                            * tape_size], 'big')
+                        >> tape_padding for tape in tape_data]
+                block = data if (len(data) == size) \
+                    else data[k * size:(k + 1) * size]
+                view, output = self.__simulate_int(
+                    *mats, keys, self.__to_state(block), rand)
+                for p in range(3):
+                    views[p][k * tape_size:(k + 1) * tape_size] = \
+                        (view[p] << tape_padding).to_bytes(tape_size, 'big')
+                    outputs[p][k * size:(k + 1) * size] = \
+                        self.__from_state(output[p])
+
+        if (is_list):
+            return ([[bytes(view[i:i + tape_size])
+                      for i in range(0, len(view), tape_size)]
+                     for view in views],
+                    [[bytes(output[i:i + size])
+                      for i in range(0, len(output), size)]
+                     for output in outputs])
+        return ([bytes(view) for view in views],
+                [bytes(output) for output in outputs])
+
+    def encrypt_into(self, src: bytes, dst: bytearray, mode: str = 'ecb',
+                     iv: Optional[bytes] = None) -> None:
+        """Encryption of a buffer of plaintexts into a preallocated buffer.
+
+        Both buffers can be any object supporting the buffer protocol, e.g.
+        bytearray, memoryview, mmap or a contiguous NumPy array. Nothing is
+        copied per block apart from the integer state of the CBC chain.
+
+        Args:
+            src:    A buffer holding the plaintexts back to back
+            dst:    A writable buffer of the same length, may be src itself
+            mode:   'ecb' or 'cbc'
+            iv:     For 'cbc' the initialization vector, a bytearray of
+                    length self.__blocksize_bytes. The last block of dst is
+                    the iv to continue the chain with.
+        """
+        self.__process_into(src, dst, True, mode, iv)
+
+    def decrypt_into(self, src: bytes, dst: bytearray, mode: str = 'ecb',
+                     iv: Optional[bytes] = None) -> None:
+        """Decryption of a buffer of ciphertexts into a preallocated buffer.
+
+        Args:
+            src:    A buffer holding the ciphertexts back to back
+            dst:    A writable buffer of the same length, may be src itself
+            mode:   'ecb' or 'cbc'
+            iv:     For 'cbc' the initialization vector, a bytearray of
+                    length self.__blocksize_bytes. The last block of src is
+                    the iv to continue the chain with.
+        """
+        self.__process_into(src, dst, False, mode, iv)
+
+    def __process_into(self, src: bytes, dst: bytearray, encrypt: bool,
+                       mode: str, iv: Optional[bytes]) -> None:
+        assert (self.__priv_key is not None), "Private key not set"
+        assert (mode in ('ecb', 'cbc')), "Mode is neither 'ecb' nor 'cbc'"
+
+        size = self.__blocksize_bytes
+        with memoryview(src) as src_buf, memoryview(dst) as dst_buf, \
+                src_buf.cast('B') as src_view, \
+                dst_buf.cast('B') as dst_view:
+            assert (not dst_view.readonly), "Destination is read-only"
+            assert (len(src_view) == len(dst_view)), \
+                "Source and destination have different lengths"
+            assert (len(src_view) % size == 0), \
+                "Buffer length is not a multiple of blocksize"
+
+            if (mode == 'ecb'):
+                self.__process_ecb(src_view, dst_view, encrypt)
+                return
+
+            assert (self.__padding == 0), \
+                "CBC mode needs a blocksize that is a multiple of 8"
+            assert ((iv is not None) and (len(iv) == size)), \
+                "IV has length != blocksize"
+            if (encrypt):
+                self.__encrypt_cbc(src_view, dst_view, iv)
+            else:
+                self.__decrypt_cbc(src_view, dst_view, iv)
+
+    def __process_ecb(self, src: memoryview, dst: memoryview,
+                      encrypt: bool) -> None:
+        size = self.__blocksize_bytes
+        if ((_import_numpy() is not None) and self.__engine.batch
+                and (self.__sliced_min_blocks is not None)
+                and (len(src) >= self.__sliced_min_blocks * size)):
+            chunk_bytes = self.batch_chunk * size
+            for start in range(0, len(src), chunk_bytes):
+                stop = min(start + chunk_bytes, len(src))
+                blocks = np.frombuffer(src[start:stop], dtype=np.uint8)
+                dst[start:stop] = self.__process_sliced(
+                    blocks.reshape(-1, size), encrypt).reshape(-1)
+        else:
+            process = self.__encrypt_state if encrypt \
+                else self.__decrypt_state
+            for start in range(0, len(src), size):
+                dst[start:start + size] = self.__from_state(
+                    process(self.__to_state(src[start:start + size])))
+
+    def __encrypt_cbc(self, src: memoryview, dst: memoryview,
+                      iv: bytes) -> None:
+        # Inherently sequential, every block depends on the previous one
+        size = self.__blocksize_bytes
+        chain = int.from_bytes(iv, 'big')
+        for start in range(0, len(src), size):
+            state = int.from_bytes(src[start:start + size], 'big') ^ chain
+            chain = self.__encrypt_state(state)
+            dst[start:start + size] = chain.to_bytes(size, 'big')
+
+    def __decrypt_cbc(self, src: memoryview, dst: memoryview,
+                      iv: bytes) -> None:
+        # The blocks are decrypted in batches and XORed with the preceding
+        # ciphertexts, which are saved first since dst may be src
+        size = self.__blocksize_bytes
+        chunk_bytes = self.batch_chunk * size
+        chain = bytes(iv)
+        for start in range(0, len(src), chunk_bytes):
+            stop = min(start + chunk_bytes, len(src))
+            ciphertexts = bytes(src[start:stop])
+            self.__process_ecb(memoryview(ciphertexts), dst[start:stop],
+                               False)
+            length = stop - start
+            dst[start:stop] = (
+                int.from_bytes(dst[start:stop], 'big')
+                ^ int.from_bytes(chain + ciphertexts[:-size], 'big')
+            ).to_bytes(length, 'big')
+            chain = ciphertexts[-size:]
+
+    def encrypt_parallel(self, plaintexts: bytes,
+                         workers: Optional[int] = None,
+                         chunk_blocks: Optional[int] = None) -> bytes:
+        """Encryption of a large buffer of plaintexts on a pool of processes.
+
+        The constants, matrices and round keys are handed to the workers
+        through shared memory, as are the plaintexts and ciphertexts. Every
+        worker encrypts chunks of blocks in place with encrypt_into. With
+        NumPy, the workers use the batch path on the shared matrices for
+        chunks of any size and build no tables of their own. Without NumPy,
+        or with a backend without batch support like 'bitvector', every
+        worker builds the tables of its backend.
+
+        Args:
+            plaintexts:     A buffer holding the plaintexts back to back
+            workers:        Number of worker processes, defaults to the
+                            number of CPUs
+            chunk_blocks:   Number of blocks per task, defaults to
+                            LowMC.batch_chunk
+
+        Returns:
+            Bytes holding the ciphertexts back to back, in order
+
+        """
+        return self.__process_parallel(plaintexts, True, workers,
+                                       chunk_blocks)
+
+    def decrypt_parallel(self, ciphertexts: bytes,
+                         workers: Optional[int] = None,
+                         chunk_blocks: Optional[int] = None) -> bytes:
+        """Decryption of a large buffer of ciphertexts on a pool of processes.
+
+        Args:
+            ciphertexts:    A buffer holding the ciphertexts back to back
+            workers:        Number of worker processes, defaults to the
+                            number of CPUs
+            chunk_blocks:   Number of blocks per task, defaults to
+                            LowMC.batch_chunk
+
+        Returns:
+            Bytes holding the plaintexts back to back, in order
+
+        """
+        return self.__process_parallel(ciphertexts, False, workers,
+                                       chunk_blocks)
+
+    def __process_parallel(self, blocks: bytes, encrypt: bool,
+                           workers: Optional[int],
+                           chunk_blocks: Optional[int]) -> bytes:
+        assert (self.__priv_key is not None), "Private key not set"
+
+        data = memoryview(blocks).cast('B')
+        assert (len(data) % self.__blocksize_bytes == 0), \
+            "Buffer length is not a multiple of blocksize"
+        if (chunk_blocks is None):
+            chunk_blocks = self.batch_chunk
+        assert (chunk_blocks > 0), "Chunk size is not positive"
+        if (len(data) == 0):
+            return b''
+
+        chunk_bytes = chunk_blocks * self.__blocksize_bytes
+        chunks = [(start, min(start + chunk_bytes, len(data)))
+                  for start in range(0, len(data), chunk_bytes)]
+
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+
+        shared = self.__pack_shared(encrypt)
+        const_shm = shared_memory.SharedMemory(create=True, size=len(shared))
+        data_shm = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            const_shm.buf[:len(shared)] = shared
+            data_shm.buf[:len(data)] = data
+            with ProcessPoolExecutor(
+                    max_workers=workers, initializer=LowMC._parallel_init,
+                    initargs=(const_shm.name, data_shm.name, self.__param,
+                              self.__backend)) as executor:
+                for _ in executor.map(LowMC._parallel_work, chunks,
+                                      [encrypt] * len(chunks)):
+                    pass
+            return bytes(data_shm.buf[:len(data)])
+        finally:
+            const_shm.close()
+            const_shm.unlink()
+            data_shm.close()
+            data_shm.unlink()
+
+    @classmethod
+    def calibrate(cls, params: Optional[list] = None,
+                  batch_sizes: tuple = (1, 16, 256, 4096), repeat: int = 5,
+                  path: Optional[str] = None) -> dict:
+        """Time every backend on this machine and persist the fastest.
+
+        Every backend first has to reproduce the known answer of the
+        parameter set (see KNOWN_ANSWERS, the 'int' backend for other sets)
+        in single block and batch en- and decryption. Then the time per
+        block is measured for single blocks and, with NumPy, for the batch
+        path at every batch size. The results are merged into the
+        calibration file. LowMC objects created afterwards without a
+        backend argument use the fastest backend for single blocks, and
+        all objects use the batch path only for batch sizes where it beats
+        processing the blocks one by one.
+
+        Args:
+            params:         Names or tuples of the parameter sets, by
+                            default all PARAMETER_SETS with a constants file
+            batch_sizes:    The numbers of blocks to time the batch path with
+            repeat:         Number of timed calls per measurement
+            path:           The calibration file, by default CALIBRATION_FILE
+
+        Returns:
+            A dict mapping the name of every calibrated parameter set to
+            its calibration: 'backend' (the fastest for single blocks),
+            'sliced_min_blocks' (per backend the smallest batch size for the
+            batch path, None if it is never faster) and 'seconds' (per
+            backend the time per block of 'block' calls and of the 'sliced'
+            batch path per batch size)
+
+        """
+        global _calibration
+        import json
+
+        if (path is None):
+            path = CALIBRATION_FILE
+        if (params is None):
+            params = [name for name in PARAMETER_SETS
+                      if any(os.path.exists(_find_constants(name) + extension)
+                             for extension in ('.bin', '.dat'))]
+
+        results = {}
+        for param in params:
+            seconds = {}
+            sliced_min_blocks = {}
+            for backend in BACKENDS:
+                lowmc = cls(param, backend)
+                lowmc.__check_known_answer()
+                block = os.urandom(lowmc.__blocksize_bytes)
+                seconds[backend] = {
+                    'block': _median_time(lambda: lowmc.encrypt(block),
+                                          repeat)}
+                sliced_min_blocks[backend] = None
+                if ((_import_numpy() is None)
+                        or (not BACKENDS[backend].batch)):
+                    continue
+
+                lowmc.__sliced_min_blocks = 1
+                sliced = {}
+                for size in sorted(batch_sizes):
+                    data = os.urandom(size * lowmc.__blocksize_bytes)
+                    sliced[str(size)] = _median_time(
+                        lambda: lowmc.encrypt_many(data), repeat) / size
+                seconds[backend]['sliced'] = sliced
+                # Smallest size from which on the batch path always wins
+                for size in sorted(batch_sizes, reverse=True):
+                    if (sliced[str(size)] >= seconds[backend]['block']):
+                        break
+                    sliced_min_blocks[backend] = size
+
+            results[parameter_set(param)[0]] = {
+                'backend': min(seconds,
+                               key=lambda name: seconds[name]['block']),
+                'sliced_min_blocks': sliced_min_blocks,
+                'seconds': seconds}
+
+        calibration = {}
+        try:
+            with open(path) as infile:
+                calibration = json.load(infile)
+        except (OSError, ValueError):
+            pass
+        calibration.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tempname = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tempname, 'w') as outfile:
+            json.dump(calibration, outfile, indent=2, sort_keys=True)
+        os.replace(tempname, path)
+
+        with _calibration_lock:
+            _calibration = (None, {})
+        return results
+
+    def __check_known_answer(self) -> None:
+        # Raises if this object does not reproduce the known answer, with
+        # the batch path forced on
+        if (self.__filename in KNOWN_ANSWERS):
+            key, plain, cipher = (bytes.fromhex(value) for value
+                                  in KNOWN_ANSWERS[self.__filename])
+        else:
+            key = bytes(range(self.__keysize_bytes))
+            plain = self.__from_state(self.__to_state(
+                bytes(range(1, self.__blocksize_bytes + 1))))
+            reference = LowMC(self.__param, 'int')
+            reference.private_key = key
+            cipher = reference.encrypt(plain)
+
+        sliced_min_blocks = self.__sliced_min_blocks
+        self.__sliced_min_blocks = 1
+        self.private_key = key
+        valid = (self.encrypt(plain) == cipher) \
+            and (self.decrypt(cipher) == plain) \
+            and (self.encrypt_many([plain] * 3) == [cipher] * 3) \
+            and (self.decrypt_many([cipher] * 3) == [plain] * 3)
+        self.__sliced_min_blocks = sliced_min_blocks
+        if (not valid):
+            raise Exception('Backend {} fails the known answer of {}'
+                            .format(self.__backend, self.__filename))
+
+    def __pack_shared(self, encrypt: bool) -> bytes:
+        # All backends share the packed constants
+        constants = self.__constants
+        n = self.__blocksize
+        parts = [SHARED_HEADER.pack(SHARED_MAGIC, n, self.__keysize,
+                                    self.__number_sboxes,
+                                    self.__number_rounds, not encrypt,
+                                    constants.digest),
+                 self.__pack_rows((int(self.__priv_key),), self.__keysize),
+                 constants.lin_layer.data]
+        if (not encrypt):
+            parts.append(self.__get_lin_layer_inv().data)
+        parts.append(self.__pack_rows(constants.round_consts, n))
+        parts.append(constants.round_key_mats.data)
+        parts.append(self.__pack_rows(
+            tuple(int(round_key) for round_key in self.__round_keys), n))
+        return b''.join(parts)
+
+    @staticmethod
+    def _parallel_init(const_name: str, data_name: str, param: str,
+                       backend: str) -> None:
+        # Initializer of the worker processes of encrypt_parallel: puts the
+        # shared constants into the constants cache of this process and
+        # sets up a LowMC object with the shared round keys. The matrices
+        # stay in the shared segment, which is kept open for the lifetime
+        # of the worker, and the NumPy batch path works on them without
+        # any further table. Only without it, every worker builds the
+        # tables of its backend for the block by block round loop.
+        global _parallel_worker
+        from multiprocessing import shared_memory
+
+        # The worker processes share the resource tracker of the creating
+        # process, which unlinks the segments
+        const_shm = shared_memory.SharedMemory(name=const_name)
+        view = const_shm.buf
+        (magic, n, keysize, number_sboxes, number_rounds, with_inverse,
+         digest) = SHARED_HEADER.unpack_from(view, 0)
+        assert magic == SHARED_MAGIC, "Not a LowMC shared memory segment!"
+        offset = SHARED_HEADER.size
+
+        def unpack(count: int, width: int) -> tuple:
+            nonlocal offset
+            rows = LowMC.__unpack_rows(view, offset, count, width)
+            offset += count * ((width + 7) // 8)
+            return rows
+
+        def matrices(count: int, width: int) -> _Matrices:
+            nonlocal offset
+            size = count * n * ((width + 7) // 8)
+            mats = _Matrices(view[offset:offset + size], count, n, width)
+            offset += size
+            return mats
+
+        priv_key = unpack(1, keysize)[0]
+        lin_layer = matrices(number_rounds, n)
+        lin_layer_inv = None
+        if (with_inverse):
+            lin_layer_inv = matrices(number_rounds, n)
+        round_consts = unpack(number_rounds, n)
+        round_key_mats = matrices(number_rounds + 1, keysize)
+        round_keys = unpack(number_rounds + 1, n)
+
+        constants = _Constants(lin_layer, round_consts, round_key_mats,
+                               digest)
+        constants.lin_layer_inv = lin_layer_inv
+        lowmc = LowMC(param, backend)
+        # Replaces constants inherited from the creating process, so the
+        # worker only reads the shared segment
+        with _constants_cache_lock:
+            _constants_cache[lowmc.__filename] = constants
+
+        lowmc.__load_constants()
+        lowmc.__priv_key = BitVector(intVal=priv_key, size=keysize)
+        lowmc.__round_keys = [lowmc.__engine.wrap(round_key)
+                              for round_key in round_keys]
+        lowmc.__sliced_min_blocks = 1
+        _parallel_worker = (lowmc, const_shm,
+                            shared_memory.SharedMemory(name=data_name))
+
+    @staticmethod
+    def _parallel_work(chunk: tuple, encrypt: bool) -> None:
+        # Processes the bytes chunk[0]:chunk[1] of the shared data in place
+        lowmc, _, data_shm = _parallel_worker
+        start, stop = chunk
+        with memoryview(data_shm.buf)[start:stop] as view:
+            if (encrypt):
+                lowmc.encrypt_into(view, view)
+            else:
+                lowmc.decrypt_into(view, view)
+
+    def __process_sliced(self, blocks: 'np.ndarray',
+                         encrypt: bool) -> 'np.ndarray':
+        # Bitsliced state: row i holds bit i of every block, packed into
+        # 64-bit words with block k in bit (k % 64) of word (k // 64).
+        tables = self.__get_sliced_tables(encrypt)
+        number_blocks = len(blocks)
+        state = self.__slice(blocks, self.__blocksize)
+
+        round_keys = self.__round_keys
+        round_consts = self.__constants.round_consts
+        if (self.__stats is not None):
+            state = self.__process_profiled(
+                state, encrypt, self.__apply_sbox_sliced if encrypt
+                else self.__apply_sbox_inv_sliced,
+                lambda r, state: self.__multiply_sliced(tables[r], state),
+                lambda state, value: state ^ self.__sliced_mask(value),
+                round_consts, number_blocks)
+        elif (self.__engine.hoisted):
+            if (encrypt):
+                state ^= self.__sliced_mask(round_keys[0])
+                for i in range(self.__number_rounds):
+                    state = self.__apply_sbox_sliced(state)
+                    state ^= self.__sliced_mask(round_keys[i + 1])
+                    state = self.__multiply_sliced(tables[i], state)
+            else:
+                for i in range(self.__number_rounds, 0, -1):
+                    state = self.__multiply_sliced(tables[i - 1], state)
+                    state ^= self.__sliced_mask(round_keys[i])
+                    state = self.__apply_sbox_inv_sliced(state)
+                state ^= self.__sliced_mask(round_keys[0])
+        elif (encrypt):
+            state ^= self.__sliced_mask(round_keys[0])
+            for i in range(self.__number_rounds):
+                state = self.__apply_sbox_sliced(state)
+                state = self.__multiply_sliced(tables[i], state)
+                state ^= self.__sliced_mask(round_consts[i]
+                                            ^ round_keys[i + 1])
+        else:
+            for i in range(self.__number_rounds, 0, -1):
+                state ^= self.__sliced_mask(round_consts[i - 1]
+                                            ^ round_keys[i])
+                state = self.__multiply_sliced(tables[i - 1], state)
+                state = self.__apply_sbox_inv_sliced(state)
+            state ^= self.__sliced_mask(round_keys[0])
+
+        return self.__unslice(state, number_blocks)
+
+    @staticmethod
+    def __join(blocks: Union[list, bytes], size: int) -> bytes:
+        # Blocks given as a list or as one buffer, as bytes back to back
+        if (isinstance(blocks, (list, tuple))):
+            for block in blocks:
+                assert (len(block) == size), "Block has length != {}" \
+                    .format(size)
+            return b''.join(blocks)
+        data = bytes(memoryview(blocks).cast('B'))
+        assert (len(data) % size == 0), \
+            "Buffer length is not a multiple of {}".format(size)
+        return data
+
+    @staticmethod
+    def __slice(blocks: 'np.ndarray', width: int) -> 'np.ndarray':
+        # Bitsliced state: row i holds bit i of every block, packed into
+        # 64-bit words with block k in bit (k % 64) of word (k // 64).
+        number_blocks = len(blocks)
+        bits = np.zeros((width, ((number_blocks + 63) // 64) * 64),
+                        dtype=np.uint8)
+        bits[:, :number_blocks] = np.unpackbits(blocks, axis=1)[:, :width].T
+        return np.packbits(bits, axis=1, bitorder='little').view('<u8')
+
+    @staticmethod
+    def __unslice(state: 'np.ndarray', number_blocks: int) -> 'np.ndarray':
+        bits = np.unpackbits(state.view(np.uint8), axis=1, bitorder='little')
+        return np.packbits(bits[:, :number_blocks].T, axis=1)
+
+    def __encrypt_sliced_keys(self, keys: 'np.ndarray',
+                              blocks: 'np.ndarray') -> 'np.ndarray':
+        # Bitsliced across keys: round key r of all keys is the product of
+        # the round key matrix with the bitsliced keys, computed with the
+        # same method of the four russians as the linear layers. Blocks
+        # holds one plaintext per key or a single one for all keys.
+        number_keys = len(keys)
+        key_state = self.__slice(keys, self.__keysize)
+        if (len(blocks) == 1):
+            state = np.repeat(self.__sliced_mask(self.__to_state(blocks[0])),
+                              key_state.shape[1], axis=1)
+        else:
+            state = self.__slice(blocks, self.__blocksize)
+
+        tables = self.__get_sliced_tables(True)
+        key_tables = self.__get_sliced_key_tables()
+
+        state ^= self.__multiply_sliced(key_tables[0], key_state)
+        for i in range(self.__number_rounds):
+            state = self.__apply_sbox_sliced(state)
+            state = self.__multiply_sliced(tables[i], state)
+            state ^= self.__sliced_mask(self.__constants.round_consts[i])
+            state ^= self.__multiply_sliced(key_tables[i + 1], key_state)
+        return self.__unslice(state, number_keys)
+
+    def __simulate_sliced(self, key_shares: list, blocks: 'np.ndarray',
+                          tapes: list) -> tuple:
+        # The repetitions of simulate_mpc bitsliced like the keys in
+        # __encrypt_sliced_keys, one state, key and tape per party. Row j
+        # of a sliced tape or view belongs to AND gate j.
+        number = len(key_shares[0])
+        gates = 3 * self.__number_sboxes
+        keys = [self.__slice(shares, self.__keysize) for shares in key_shares]
+        rand = [self.__slice(tape, gates * self.__number_rounds)
+                for tape in tapes]
+        views = [np.zeros_like(tape) for tape in rand]
+
+        tables = self.__get_sliced_tables(True)
+        key_tables = self.__get_sliced_key_tables()
+
+        states = [self.__multiply_sliced(key_tables[0], key) for key in keys]
+        if (len(blocks) == 1):
+            states[0] ^= self.__sliced_mask(self.__to_state(blocks[0]))
+        else:
+            states[0] ^= self.__slice(blocks, self.__blocksize)
+        for i in range(self.__number_rounds):
+            part = slice(i * gates, (i + 1) * gates)
+            self.__apply_sbox_mpc_sliced(states, [tape[part] for tape in rand],
+                                         [view[part] for view in views])
+            states = [self.__multiply_sliced(tables[i], state)
+                      for state in states]
+            states[0] ^= self.__sliced_mask(
+                self.__constants.round_consts[i])
+            for state, key in zip(states, keys):
+                state ^= self.__multiply_sliced(key_tables[i + 1], key)
+        return ([self.__unslice(view, number) for view in views],
+                [self.__unslice(state, number) for state in states])
+
+    def __apply_sbox_mpc_sliced(self, states: list, rand: list,
+                                views: list) -> None:
+        # Shared sbox layer on the bitsliced states, in place. rand and
+        # views hold the rows of the AND gates of this round.
+        sbox_bits = 3 * self.__number_sboxes
+        c = [state[0:sbox_bits:3] for state in states]
+        b = [state[1:sbox_bits:3] for state in states]
+        a = [state[2:sbox_bits:3] for state in states]
+        ab = self.__and_mpc(a, b, [tape[0::3] for tape in rand])
+        bc = self.__and_mpc(b, c, [tape[1::3] for tape in rand])
+        ca = self.__and_mpc(c, a, [tape[2::3] for tape in rand])
+        for p in range(3):
+            views[p][0::3] = ab[p]
+            views[p][1::3] = bc[p]
+            views[p][2::3] = ca[p]
+            new_a = a[p] ^ bc[p]
+            new_b = a[p] ^ b[p] ^ ca[p]
+            new_c = a[p] ^ b[p] ^ c[p] ^ ab[p]
+            states[p][2:sbox_bits:3] = new_a
+            states[p][1:sbox_bits:3] = new_b
+            states[p][0:sbox_bits:3] = new_c
+
+    def __simulate_int(self, lin_layer: tuple, round_key_mats: tuple,
+                       keys: list, block: int, rand: list) -> tuple:
+        # One repetition of simulate_mpc on integer states, keys and tapes.
+        # Within the sbox bits of a state, bit 3i is the bit a of an sbox,
+        # see _build_sbox_layer, and bit 3i + 2 of the gates of a round
+        # belongs to its gate a*b.
+        gates = 3 * self.__number_sboxes
+        gates_mask = (1 << gates) - 1
+        shift = self.__blocksize - gates
+        low = int('001' * self.__number_sboxes, 2)
+
+        states = [gf2.multiply_vec(round_key_mats[0], key) for key in keys]
+        states[0] ^= block
+        views = [0, 0, 0]
+        for i in range(self.__number_rounds):
+            offset = gates * (self.__number_rounds - 1 - i)
+            tapes = [(tape >> offset) & gates_mask for tape in rand]
+            a = [(state >> shift) & low for state in states]
+            b = [(state >> (shift + 1)) & low for state in states]
+            c = [(state >> (shift + 2)) & low for state in states]
+            ab = self.__and_mpc(a, b, [(tape >> 2) & low for tape in tapes])
+            bc = self.__and_mpc(b, c, [(tape >> 1) & low for tape in tapes])
+            ca = self.__and_mpc(c, a, [tape & low for tape in tapes])
+            for p in range(3):
+                views[p] = (views[p] << gates) | (ab[p] << 2) \
+                    | (bc[p] << 1) | ca[p]
+                sbox = (a[p] ^ bc[p]) | ((a[p] ^ b[p] ^ ca[p]) << 1) \
+                    | ((a[p] ^ b[p] ^ c[p] ^ ab[p]) << 2)
+                state = (states[p] & ((1 << shift) - 1)) | (sbox << shift)
+                state = gf2.multiply_vec(lin_layer[i], state)
+                states[p] = state ^ gf2.multiply_vec(
+                    round_key_mats[i + 1], keys[p])
+            states[0] ^= self.__constants.round_consts[i]
+        return views, states
+
+    @staticmethod
+    def __and_mpc(x: list, y: list, rand: list) -> list:
+        # Output shares of the AND of the shares x and y, party p uses the
+        # shares and random bits of the parties p and p + 1
+        return [(x[p] & y[q]) ^ (x[q] & y[p]) ^ (x[p] & y[p])
+                ^ rand[p] ^ rand[q] for p, q in ((0, 1), (1, 2), (2, 0))]
+
+    def __get_sliced_key_tables(self) -> 'np.ndarray':
+        # Packed rows of the round key matrices, see __get_sliced_tables
+        return self.__sliced_view(self.__constants.round_key_mats)
+
+    def __get_sliced_tables(self, encrypt: bool) -> 'np.ndarray':
+        # The packed rows of a matrix are, per byte of the input, the index
+        # into the table of XOR combinations built in __multiply_sliced
+        if (encrypt):
+            return self.__sliced_view(self.__constants.lin_layer)
+        return self.__sliced_view(self.__get_lin_layer_inv())
+
+    @staticmethod
+    def __sliced_view(mats: _Matrices) -> 'np.ndarray':
+        # The packed matrices without a copy, indexed by matrix, row and
+        # byte of the row
+        return np.frombuffer(mats.data, dtype=np.uint8).reshape(
+            mats.count, mats.rows, mats.row_bytes)
+
+    def __sliced_mask(self, value: int) -> 'np.ndarray':
+        # Column of all-zero or all-one words for the bits of value
+        bits = np.unpackbits(np.frombuffer(
+            (value << self.__padding).to_bytes(self.__blocksize_bytes, 'big'),
+            dtype=np.uint8))[:self.__blocksize]
+        return (bits.astype(np.uint64) * np.uint64(0xFFFFFFFFFFFFFFFF)) \
+            .reshape(-1, 1)
+
+    def __apply_sbox_sliced(self, state: 'np.ndarray') -> 'np.ndarray':
+        # Bit 3i + 2 is the most significant sbox input bit, see
+        # BitVectorBackend.apply_sbox for the reversed bit order
+        sbox_bits = 3 * self.__number_sboxes
+        c = state[0:sbox_bits:3]
+        b = state[1:sbox_bits:3]
+        a = state[2:sbox_bits:3]
+        new_a = a ^ (b & c)
+        new_b = a ^ b ^ (a & c)
+        new_c = a ^ b ^ c ^ (a & b)
+        state[2:sbox_bits:3] = new_a
+        state[1:sbox_bits:3] = new_b
+        state[0:sbox_bits:3] = new_c
+        return state
+
+    def __apply_sbox_inv_sliced(self, state: 'np.ndarray') -> 'np.ndarray':
+        sbox_bits = 3 * self.__number_sboxes
+        c = state[0:sbox_bits:3]
+        b = state[1:sbox_bits:3]
+        a = state[2:sbox_bits:3]
+        new_a = a ^ b ^ (b & c)
+        new_b = b ^ (a & c)
+        new_c = a ^ b ^ c ^ (a & b)
+        state[2:sbox_bits:3] = new_a
+        state[1:sbox_bits:3] = new_b
+        state[0:sbox_bits:3] = new_c
+        return state
+
+    @staticmethod
+    def __multiply_sliced(index: 'np.ndarray',
+                          state: 'np.ndarray') -> 'np.ndarray':
+        # Method of the four russians on the bitsliced state: for every
+        # group of 8 input rows, all 256 XOR combinations of them are
+        # tabulated and each output row gathers one entry per group.
+        groups = index.shape[1]
+        words = state.shape[1]
+        if (state.shape[0] < 8 * groups):
+            state = np.concatenate((state, np.zeros(
+                (8 * groups - state.shape[0], words), dtype=np.uint64)))
+        state = state.reshape(groups, 8, words)
+        table = np.zeros((groups, 256, words), dtype=np.uint64)
+        for k in range(8):
+            step = 1 << k
+            table[:, step:2 * step] = table[:, :step] \
+                ^ state[:, 7 - k, np.newaxis, :]
+        return np.bitwise_xor.reduce(table[np.arange(groups), index], axis=1)
+
+    def __to_state(self, block: bytes) -> int:
+        # Integer state of a block, without the padding bits
+        return int.from_bytes(block, 'big') >> self.__padding
+
+    def __from_state(self, state: int) -> bytes:
+        return (state << self.__padding).to_bytes(self.__blocksize_bytes,
+                                                  'big')
+
+    def __encrypt_state(self, state: int) -> int:
+        # Encryption of an integer state by the backend
+        engine = self.__engine
+        engine.prepare(True)
+        if (self.__stats is not None):
+            sbox, linear, round_consts = engine.layers(True)
+            return int(self.__process_profiled(
+                engine.wrap(state), True, sbox, linear,
+                lambda state, value: state ^ value, round_consts))
+        return engine.encrypt(self.__round_keys, state)
+
+    def __decrypt_state(self, state: int) -> int:
+        engine = self.__engine
+        engine.prepare(False)
+        if (self.__stats is not None):
+            sbox, linear, round_consts = engine.layers(False)
+            return int(self.__process_profiled(
+                engine.wrap(state), False, sbox, linear,
+                lambda state, value: state ^ value, round_consts))
+        return engine.decrypt(self.__round_keys, state)
+
+    def __process_profiled(self, state: object, encrypt: bool,
+                           sbox: callable, linear: callable, add: callable,
+                           round_consts: tuple, blocks: int = 1) -> object:
+        # The round loop of all backends with every phase timed. sbox(state)
+        # and linear(r, state) apply the layers of the direction, add(state,
+        # value) XORs a round key or constant (in the representation of the
+        # backend) into the state. The times are summed up locally and
+        # recorded once.
+        timer = time.perf_counter
+        seconds = dict.fromkeys(('key_addition', 'constant_addition',
+                                 'sbox', 'linear_layer'), 0.0)
+        calls = dict.fromkeys(seconds, 0)
+
+        def run(phase: str, function: callable, *args) -> object:
+            start = timer()
+            result = function(*args)
+            seconds[phase] += timer() - start
+            calls[phase] += 1
+            return result
+
+        round_keys = self.__round_keys
+        hoisted = self.__engine.hoisted
+        start = timer()
+
+        if (encrypt):
+            state = run('key_addition', add, state, round_keys[0])
+            for i in range(self.__number_rounds):
+                state = run('sbox', sbox, state)
+                if (hoisted):
+                    state = run('key_addition', add, state, round_keys[i + 1])
+                    state = run('linear_layer', linear, i, state)
+                else:
+                    state = run('linear_layer', linear, i, state)
+                    state = run('constant_addition', add, state,
+                                round_consts[i])
+                    state = run('key_addition', add, state, round_keys[i + 1])
+        else:
+            for i in range(self.__number_rounds, 0, -1):
+                if (hoisted):
+                    state = run('linear_layer', linear, i - 1, state)
+                    state = run('key_addition', add, state, round_keys[i])
+                else:
+                    state = run('key_addition', add, state, round_keys[i])
+                    state = run('constant_addition', add, state,
+                                round_consts[i - 1])
+                    state = run('linear_layer', linear, i - 1, state)
+                state = run('sbox', sbox, state)
+            state = run('key_addition', add, state, round_keys[0])
+
+        total = timer() - start
+        for phase in seconds:
+            self.__stats.add(phase, seconds[phase], calls[phase])
+        self.__stats.add('encrypt' if encrypt else 'decrypt', total, blocks)
+        return state
+
+    def __record(self, phase: str, start: float, calls: int = 1) -> None:
+        # Records the time since start if a stats object is attached
+        if (self.__stats is not None):
+            self.__stats.add(phase, time.perf_counter() - start, calls)
+
+    @staticmethod
+    def __deep_sizeof(obj: object) -> int:
+        # Size of an object including the containers, ints, BitVectors and
+        # buffers it holds
+        size = sys.getsizeof(obj)
+        if (isinstance(obj, (tuple, list))):
+            size += sum(LowMC.__deep_sizeof(item) for item in obj)
+        elif (isinstance(obj, dict)):
+            size += sum(LowMC.__deep_sizeof(item) for item in obj.values())
+        elif (isinstance(obj, BitVector)):
+            size += LowMC.__deep_sizeof(vars(obj))
+        elif (isinstance(obj, _Matrices)):
+            if (isinstance(obj.data, memoryview)):
+                size += obj.data.nbytes
+            else:
+                size += sys.getsizeof(obj.data)
+        elif (np is not None and isinstance(obj, np.ndarray)):
+            size = obj.nbytes
+        return size
+
+    def __load_constants(self) -> None:
+        # The constants are loaded on first use (setting the key or a call
+        # that does not need the key), not by the constructor
+        if (self.__engine is not None):
+            return
+
+        start = time.perf_counter()
+        # All backends share the packed constants, each one unpacks only
+        # what its round loop needs
+        self.__constants = self.__get_constants()
+        engine = BACKENDS[self.__backend](
+            (self.__filename, self.__blocksize, self.__keysize,
+             self.__number_sboxes, self.__number_rounds),
+            self.__constants, self.__get_lin_layer_inv)
+        # Set last, marks the constants as loaded for concurrent callers
+        self.__engine = engine
+        self.__record('load_constants', start)
+
+    def __get_constants(self) -> _Constants:
+        cache_key = self.__filename
+
+        with _constants_cache_lock:
+            constants = _constants_cache.get(cache_key)
+            if (constants is not None):
+                _constants_cache.move_to_end(cache_key)
+                return constants
+
+        constants = self.__read_constants()
+
+        with _constants_cache_lock:
+            constants = _constants_cache.setdefault(cache_key, constants)
+            _evict_constants()
+        return constants
+
+    def __get_lin_layer_inv(self) -> _Matrices:
+        # The packed inverse linear layers, read from the inverse file or
+        # computed on first use
+        constants = self.__constants
+        if (constants.lin_layer_inv is not None):
+            return constants.lin_layer_inv
+        with _inverse_lock:
+            if (constants.lin_layer_inv is None):
+                start = time.perf_counter()
+                lin_layer_inv = self.__read_lin_layer_inv(constants.digest)
+                self.__record('load_inverse', start)
+                if (lin_layer_inv is None):
+                    start = time.perf_counter()
+                    lin_layer_inv = self.__invert_lin_matrix(
+                        constants.lin_layer)
+                    self.__record('inversion', start)
+                    self.__write_lin_layer_inv(lin_layer_inv,
+                                               constants.digest)
+                constants.lin_layer_inv = lin_layer_inv
+        return constants.lin_layer_inv
+
+    def __read_constants(self) -> _Constants:
+        # Prefer the binary constants file and fall back to the text file
+        path = _find_constants(self.__filename)
+        if (os.path.exists(path + '.bin')):
+            return self.__read_constants_binary(path)
+        else:
+            return self.__read_constants_text(path)
+
+    def __read_constants_binary(self, path: str) -> _Constants:
+        row_bytes = (self.__blocksize + 7) // 8
+        key_row_bytes = (self.__keysize + 7) // 8
+
+        # The matrices are views of the mapping, which stays open as long as
+        # they are referenced. Their rows are read straight from the page
+        # cache, shared by all processes that load the same file.
+        with open(path + '.bin', 'rb') as matfile:
+            view = memoryview(mmap.mmap(matfile.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+
+        # Check for correct parameters, file length and checksum
+        (magic, blocksize, keysize, number_sboxes, number_rounds,
+         digest) = BINARY_HEADER.unpack_from(view, 0)
+        assert magic == BINARY_MAGIC, \
+            "Not a LowMC constants file!"
+        self.__check_params(blocksize, keysize, number_sboxes,
+                            number_rounds)
+        assert len(view) == BINARY_HEADER.size \
+            + ((self.__number_rounds * self.__blocksize) * row_bytes) \
+            + (self.__number_rounds * row_bytes) \
+            + (((self.__number_rounds + 1) * self.__blocksize)
+               * key_row_bytes), \
+            "Wrong file size (number of bytes)"
+        assert hashlib.sha256(view[BINARY_HEADER.size:]).digest() \
+            == digest, "Wrong checksum in data file!"
+
+        # Linear layer matrices
+        offset = BINARY_HEADER.size
+        size = self.__number_rounds * self.__blocksize * row_bytes
+        lin_layer = _Matrices(view[offset:offset + size],
+                              self.__number_rounds, self.__blocksize,
+                              self.__blocksize)
+        offset += size
+
+        # Round constants
+        round_consts = self.__unpack_rows(
+            view, offset, self.__number_rounds, self.__blocksize)
+        offset += self.__number_rounds * row_bytes
+
+        # Round key matrices
+        round_key_mats = _Matrices(view[offset:], self.__number_rounds + 1,
+                                   self.__blocksize, self.__keysize)
+
+        # The checked payload digest identifies the constants, the header
+        # parameters are checked on their own wherever it is used
+        return _Constants(lin_layer, round_consts, round_key_mats, digest)
+
+    def __check_params(self, blocksize: int, keysize: int,
+                       number_sboxes: int, number_rounds: int) -> None:
+        assert blocksize == self.__blocksize, \
+            "Wrong blocksize in data file!"
+        assert keysize == self.__keysize, \
+            "Wrong keysize in data file!"
+        assert number_sboxes == self.__number_sboxes, \
+            "Wrong number of sboxes in data file!"
+        assert number_rounds == self.__number_rounds, \
+            "Wrong number of rounds in data file!"
+
+    @staticmethod
+    def __unpack_rows(view: memoryview, offset: int, count: int,
+                      width: int) -> tuple:
+        row_bytes = (width + 7) // 8
+        padding = (8 * row_bytes) - width
+        rows = []
+        for _ in range(count):
+            rows.append(int.from_bytes(view[offset:offset + row_bytes], 'big')
+                        >> padding)
+            offset += row_bytes
+        return tuple(rows)
+
+    @staticmethod
+    def __pack_rows(rows: tuple, width: int) -> bytes:
+        row_bytes = (width + 7) // 8
+        padding = (8 * row_bytes) - width
+        return b''.join((row << padding).to_bytes(row_bytes, 'big')
+                        for row in rows)
+
+    def __read_constants_text(self, path: str) -> _Constants:
+        with open(path + '.dat', 'rb') as matfile:
             const_data = matfile.read()
 
-        const_data_split = const_data.split('\n')
+        file_digest = hashlib.sha256(const_data).digest()
+        const_data_split = const_data.decode('ascii').split('\n')
 
         # Check for correct parameters and file length
         params = const_data_split[0:3]
@@ -253,78 +2398,83 @@ class LowMC(object):
         lines_offset = 3
         lines_count = self.__number_rounds * self.__blocksize
         lin_layer = const_data_split[lines_offset:(lines_offset + lines_count)]
-        for r in range(self.__number_rounds):
-            mat = []
-            for s in range(self.__blocksize):
-                bv = BitVector(bitstring=lin_layer[(r * self.__blocksize) + s])
-                mat.append(bv)
-            self.__lin_layer.append(mat)
+        lin_layer = tuple(
+            tuple(int(lin_layer[(r * self.__blocksize) + s], 2)
+                  for s in range(self.__blocksize))
+            for r in range(self.__number_rounds))
 
         # Round constants
         lines_offset += lines_count
         lines_count = self.__number_rounds
         round_consts = const_data_split[lines_offset:(lines_offset
                                         + lines_count)]
-        for line in round_consts:
-            self.__round_consts.append(BitVector(bitstring=line))
+        round_consts = tuple(int(line, 2) for line in round_consts)
 
         # Round key matrices
         lines_offset += lines_count
         lines_count = (self.__number_rounds + 1) * self.__blocksize
         round_key_mats = const_data_split[lines_offset:(lines_offset
                                           + lines_count)]
-        for r in range(self.__number_rounds + 1):
-            mat = []
-            for s in range(self.__blocksize):
-                mat.append(BitVector(
-                    bitstring=round_key_mats[(r * self.__blocksize) + s]))
-            self.__round_key_mats.append(mat)
-
-    def __invert_lin_matrix(self) -> None:
-
-        self.__lin_layer_inv = []
-        for r in range(self.__number_rounds):
-
-            # Copy lin_layer
-            mat = []
-            for i in range(self.__blocksize):
-                mat.append(self.__lin_layer[r][i].deep_copy())
-
-            # Create (initial identity) matrix, where the
-            # inverted matrix will be stored in.
-            inv_mat = []
-            for i in range(self.__blocksize):
-                temp_bv = BitVector(intVal=0, size=self.__blocksize)
-                temp_bv[i] = 1
-                inv_mat.append(temp_bv)
-
-            # Transform to upper triangular matrix
-            row = 0
-            for col in range(self.__keysize):
-                if (not mat[row][col]):
-                    r = row + 1
-                    while ((r < self.__blocksize) and (not mat[r][col])):
-                        r += 1
-                    if (r >= self.__blocksize):
-                        continue
-                    else:
-                        temp = mat[row]
-                        mat[row] = mat[r]
-                        mat[r] = temp
-                        temp = inv_mat[row]
-                        inv_mat[row] = inv_mat[r]
-                        inv_mat[r] = temp
-                for i in range(row + 1, self.__blocksize):
-                    if (mat[i][col]):
-                        mat[i] = mat[i] ^ mat[row]
-                        inv_mat[i] = inv_mat[i] ^ inv_mat[row]
-                row += 1
-
-            # Transform to inverse matrix
-            for col in range(self.__keysize, 0, -1):
-                for r in range(col - 1):
-                    if (mat[r][col - 1]):
-                        mat[r] = mat[r] ^ mat[col - 1]
-                        inv_mat[r] = inv_mat[r] ^ inv_mat[col - 1]
-
-            self.__lin_layer_inv.append(inv_mat)
+        round_key_mats = tuple(
+            tuple(int(round_key_mats[(r * self.__blocksize) + s], 2)
+                  for s in range(self.__blocksize))
+            for r in range(self.__number_rounds + 1))
+
+        return _Constants(_Matrices.from_rows(lin_layer, self.__blocksize),
+                          round_consts,
+                          _Matrices.from_rows(round_key_mats, self.__keysize),
+                          file_digest)
+
+    def __read_lin_layer_inv(self, digest: bytes) -> Optional[_Matrices]:
+        # Returns None if there is no valid inverse file for the constants
+        # with the given digest
+        row_bytes = (self.__blocksize + 7) // 8
+        try:
+            with open(_find_constants(self.__filename) + '.inv',
+                      'rb') as invfile:
+                data = invfile.read()
+        except OSError:
+            return None
+
+        if (len(data) != INVERSE_HEADER.size
+                + (self.__number_rounds * self.__blocksize * row_bytes)):
+            return None
+        (magic, blocksize, keysize, number_sboxes, number_rounds,
+         constants_digest, payload_digest) = INVERSE_HEADER.unpack_from(data)
+        if ((magic, blocksize, keysize, number_sboxes, number_rounds,
+             constants_digest) != (INVERSE_MAGIC, self.__blocksize,
+                                   self.__keysize, self.__number_sboxes,
+                                   self.__number_rounds, digest)):
+            return None
+        payload = data[INVERSE_HEADER.size:]
+        if (hashlib.sha256(payload).digest() != payload_digest):
+            return None
+
+        return _Matrices(payload, self.__number_rounds, self.__blocksize,
+                         self.__blocksize)
+
+    def __write_lin_layer_inv(self, lin_layer_inv: _Matrices,
+                              digest: bytes) -> None:
+        # The inverse file is only a cache, so failing to write it
+        # (e.g. in a read-only installation) is not an error
+        payload = lin_layer_inv.data
+        header = INVERSE_HEADER.pack(INVERSE_MAGIC, self.__blocksize,
+                                     self.__keysize, self.__number_sboxes,
+                                     self.__number_rounds, digest,
+                                     hashlib.sha256(payload).digest())
+        filename = _find_constants(self.__filename) + '.inv'
+        tempname = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            with open(tempname, 'wb') as invfile:
+                invfile.write(header)
+                invfile.write(payload)
+            os.replace(tempname, filename)
+        except OSError:
+            try:
+                os.remove(tempname)
+            except OSError:
+                pass
+
+    def __invert_lin_matrix(self, lin_layer: _Matrices) -> _Matrices:
+        return _Matrices.from_rows(tuple(gf2.invert(mat) for mat in lin_layer),
+                                   self.__blocksize)
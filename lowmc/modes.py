@@ -0,0 +1,309 @@
+"""Modes of operation and hashing on top of the LowMC blockcipher."""
+
+from collections import deque
+from lowmc import LowMC
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+
+__author__ = "Thorsten Knoll"
+__copyright__ = "Thorsten Knoll"
+__license__ = "mit"
+
+
+def ctr_keystream(lowmc: LowMC, nonce: bytes,
+                  batch_blocks: Optional[int] = None) -> Iterator[bytes]:
+    """Counter mode keystream.
+
+    The counter blocks are the nonce followed by a big endian block counter
+    starting at 0, which fills the rest of the block. They are encrypted
+    with encrypt_many in batches of batch_blocks blocks. The last batch is
+    cut short at the end of the counter space, asking for a further batch
+    fails.
+
+    Args:
+        lowmc:          A LowMC object with the private key set
+        nonce:          Must be a bytearray shorter than the blocksize
+        batch_blocks:   Number of counter blocks encrypted at once,
+                        defaults to LowMC.batch_chunk
+
+    Returns:
+        An iterator over keystream chunks of batch_blocks blocks each,
+        the last one may be shorter
+
+    """
+    base, limit = _ctr_counter_space(lowmc, nonce)
+    if (batch_blocks is None):
+        batch_blocks = lowmc.batch_chunk
+    assert (batch_blocks > 0), "Batch size is not positive"
+
+    counter = 0
+    while True:
+        count = min(batch_blocks, limit - counter)
+        yield _ctr_blocks(lowmc, base, limit, counter, count)
+        counter += count
+
+
+def ctr_encrypt(lowmc: LowMC, source: Union[Iterable[bytes], BinaryIO],
+                nonce: bytes,
+                batch_blocks: Optional[int] = None) -> Iterator[bytes]:
+    """Counter mode encryption of a stream.
+
+    The input is consumed lazily and at most one batch of keystream is held
+    at a time, so the memory use does not depend on the input size. The
+    last chunk may end with a partial block, only the blocks it needs are
+    encrypted for it. Decryption is the same operation, see ctr_decrypt.
+
+    Args:
+        lowmc:          A LowMC object with the private key set
+        source:         Either a single buffer (bytes, bytearray or
+                        memoryview), an iterable of bytearrays of any
+                        length or a binary file object
+        nonce:          Must be a bytearray shorter than the blocksize,
+                        never reuse a nonce with the same key
+        batch_blocks:   Number of counter blocks encrypted at once,
+                        defaults to LowMC.batch_chunk
+
+    Returns:
+        An iterator over the encrypted chunks, all but the last one of
+        batch_blocks blocks
+
+    """
+    size = lowmc.blocksize_bytes
+    base, limit = _ctr_counter_space(lowmc, nonce)
+    if (batch_blocks is None):
+        batch_blocks = lowmc.batch_chunk
+    assert (batch_blocks > 0), "Batch size is not positive"
+    batch_bytes = batch_blocks * size
+
+    counter = 0
+    pending = bytearray()
+    for chunk in _read_chunks(source, batch_bytes):
+        pending += chunk
+        while (len(pending) >= batch_bytes):
+            yield _xor(pending[:batch_bytes], _ctr_blocks(
+                lowmc, base, limit, counter, batch_blocks))
+            counter += batch_blocks
+            del pending[:batch_bytes]
+    if (pending):
+        yield _xor(pending, _ctr_blocks(lowmc, base, limit, counter,
+                                        -(-len(pending) // size)))
+
+
+def ctr_decrypt(lowmc: LowMC, source: Union[Iterable[bytes], BinaryIO],
+                nonce: bytes,
+                batch_blocks: Optional[int] = None) -> Iterator[bytes]:
+    """Counter mode decryption of a stream, see ctr_encrypt."""
+    return ctr_encrypt(lowmc, source, nonce, batch_blocks)
+
+
+def ctr_encrypt_file(lowmc: LowMC, infile: BinaryIO, outfile: BinaryIO,
+                     nonce: bytes, batch_blocks: Optional[int] = None) -> int:
+    """Counter mode encryption from one binary file object into another.
+
+    Args:
+        lowmc:          A LowMC object with the private key set
+        infile:         Binary file object opened for reading
+        outfile:        Binary file object opened for writing
+        nonce:          Must be a bytearray shorter than the blocksize
+        batch_blocks:   Number of counter blocks encrypted at once,
+                        defaults to LowMC.batch_chunk
+
+    Returns:
+        The number of bytes written
+
+    """
+    written = 0
+    for chunk in ctr_encrypt(lowmc, infile, nonce, batch_blocks):
+        outfile.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def merkle_hash(lowmc: LowMC, source: Union[Iterable[bytes], BinaryIO],
+                batch_blocks: Optional[int] = None, workers: int = 0) -> bytes:
+    """Hash of a stream, a Merkle tree of Davies-Meyer compressions.
+
+    The compression of a chaining block h and a message block m (the key)
+    is E_m(h) XOR h. The input is padded with a 0x80 byte and zero bytes to
+    a multiple of the blocksize, every block is compressed with a zero
+    chaining block into a leaf. The leaves are combined pairwise, the left
+    node as chaining block and the right node as message block, in a left
+    balanced tree: the left subtree of a node holds the largest power of
+    two of leaves that is less than its number of leaves. The root is
+    compressed with the bit length of the input as the last message block
+    into the hash.
+
+    The input is consumed lazily in batches of batch_blocks blocks. The
+    leaves and every level of the subtree of a batch are compressed with
+    one call to encrypt_many_keys each, only the roots of O(log n)
+    complete subtrees are kept between the batches. The tree shape only
+    depends on the input length, so the hash is the same for every batch
+    size and number of workers.
+
+    Args:
+        lowmc:          A LowMC object with equal block- and keysize, a
+                        multiple of 8. Its private key is not used.
+        source:         Either a single buffer (bytes, bytearray or
+                        memoryview), an iterable of bytearrays of any
+                        length or a binary file object
+        batch_blocks:   Number of blocks per batch, a power of two,
+                        defaults to LowMC.batch_chunk
+        workers:        Number of worker processes hashing the batches,
+                        0 hashes them in this process. At most two
+                        batches per worker are in flight at a time.
+
+    Returns:
+        The hash, a bytearray of length lowmc.blocksize_bytes
+
+    """
+    size = lowmc.blocksize_bytes
+    assert (lowmc.blocksize == lowmc.keysize) \
+        and (lowmc.blocksize % 8 == 0), \
+        "Hash mode needs blocksize == keysize, a multiple of 8"
+    if (batch_blocks is None):
+        batch_blocks = lowmc.batch_chunk
+    assert (batch_blocks > 0) and (batch_blocks & (batch_blocks - 1) == 0), \
+        "Batch size is not a power of two"
+    assert (workers >= 0), "Number of workers is negative"
+    batch_bytes = batch_blocks * size
+
+    # Roots of the complete subtrees hashed so far as (height, node), with
+    # strictly decreasing heights
+    stack = []
+
+    def push(subtrees: list) -> None:
+        for height, node in subtrees:
+            while (stack and (stack[-1][0] == height)):
+                node = _davies_meyer(lowmc, stack.pop()[1], node)
+                height += 1
+            stack.append((height, node))
+
+    executor = None
+    if (workers > 0):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_merkle_init,
+                                       initargs=(lowmc.param, lowmc.backend))
+    futures = deque()
+
+    def submit(batch: bytes) -> None:
+        if (executor is None):
+            push(_merkle_subtrees(lowmc, batch))
+            return
+        futures.append(executor.submit(_merkle_work, batch))
+        while (len(futures) > 2 * workers):
+            push(futures.popleft().result())
+
+    try:
+        length = 0
+        pending = bytearray()
+        for chunk in _read_chunks(source, batch_bytes):
+            length += len(chunk)
+            pending += chunk
+            while (len(pending) >= batch_bytes):
+                submit(bytes(pending[:batch_bytes]))
+                del pending[:batch_bytes]
+
+        pending += b'\x80' + bytes(-(len(pending) + 1) % size)
+        for start in range(0, len(pending), batch_bytes):
+            submit(bytes(pending[start:start + batch_bytes]))
+        while (futures):
+            push(futures.popleft().result())
+    finally:
+        if (executor is not None):
+            executor.shutdown(cancel_futures=True)
+
+    root = stack.pop()[1]
+    while (stack):
+        root = _davies_meyer(lowmc, stack.pop()[1], root)
+    assert (8 * length < (1 << (8 * size))), "Input is too long"
+    return _davies_meyer(lowmc, root, (8 * length).to_bytes(size, 'big'))
+
+
+def _davies_meyer(lowmc: LowMC, chaining: bytes, messages: bytes) -> bytes:
+    # Compressions E_m(h) XOR h of the message blocks back to back, with
+    # one chaining block per message block or one for all of them
+    ciphertexts = lowmc.encrypt_many_keys(messages, chaining)
+    if (len(chaining) != len(ciphertexts)):
+        chaining = chaining * (len(ciphertexts) // len(chaining))
+    return _xor(ciphertexts, chaining)
+
+
+def _merkle_subtrees(lowmc: LowMC, batch: bytes) -> list:
+    # Roots of the complete subtrees of a batch of blocks as (height, node),
+    # from left to right. Level by level, the last node of a level with an
+    # odd number of nodes is the root of a complete subtree that is not
+    # combined within the batch. A batch of batch_blocks blocks is a single
+    # complete subtree.
+    size = lowmc.blocksize_bytes
+    nodes = _davies_meyer(lowmc, bytes(size), batch)
+    subtrees = []
+    height = 0
+    while (nodes):
+        if ((len(nodes) // size) % 2):
+            subtrees.append((height, nodes[-size:]))
+            nodes = nodes[:-size]
+        pairs = range(0, len(nodes), 2 * size)
+        if (pairs):
+            nodes = _davies_meyer(
+                lowmc, b''.join(nodes[i:i + size] for i in pairs),
+                b''.join(nodes[i + size:i + 2 * size] for i in pairs))
+        height += 1
+    subtrees.reverse()
+    return subtrees
+
+
+# The LowMC object of a worker process of merkle_hash
+_merkle_worker = None
+
+
+def _merkle_init(param: Union[str, tuple], backend: str) -> None:
+    global _merkle_worker
+    _merkle_worker = LowMC(param, backend)
+
+
+def _merkle_work(batch: bytes) -> list:
+    return _merkle_subtrees(_merkle_worker, batch)
+
+
+def _ctr_counter_space(lowmc: LowMC, nonce: bytes) -> tuple:
+    # The nonce as the high bits of a counter block and the number of
+    # counter blocks of the nonce
+    size = lowmc.blocksize_bytes
+    assert (lowmc.blocksize % 8 == 0), \
+        "Counter mode needs a blocksize that is a multiple of 8"
+    assert (len(nonce) < size), "Nonce has length >= blocksize"
+    counter_bits = 8 * (size - len(nonce))
+    return int.from_bytes(nonce, 'big') << counter_bits, 1 << counter_bits
+
+
+def _ctr_blocks(lowmc: LowMC, base: int, limit: int, counter: int,
+                count: int) -> bytes:
+    # Keystream of the count counter blocks from counter on
+    assert (0 < count) and (counter + count <= limit), \
+        "Counter space of the nonce is exhausted"
+    size = lowmc.blocksize_bytes
+    return lowmc.encrypt_many(b''.join(
+        (base | i).to_bytes(size, 'big')
+        for i in range(counter, counter + count)))
+
+
+def _read_chunks(source: Union[Iterable[bytes], BinaryIO],
+                 size: int) -> Iterator[bytes]:
+    if (hasattr(source, 'read')):
+        while True:
+            chunk = source.read(size)
+            if (not chunk):
+                return
+            yield chunk
+    elif (isinstance(source, (bytes, bytearray, memoryview))):
+        # A single buffer is one chunk, iterating it would yield integers
+        yield memoryview(source).cast('B')
+    else:
+        yield from source
+
+
+def _xor(data: bytes, keystream: bytes) -> bytes:
+    length = len(data)
+    return (int.from_bytes(data, 'big')
+            ^ int.from_bytes(keystream[:length], 'big')).to_bytes(length,
+                                                                 'big')
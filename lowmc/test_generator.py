@@ -0,0 +1,59 @@
+'''
+LowMC Generator Tests
+Author: Thorsten Knoll
+
+Description:
+Compares the word-parallel GrainSSG with the
+bit by bit grain_ssg generator and the first
+linear layer it instantiates with the one in
+the 'picnic-L1' constants file.
+'''
+from generator import GrainSSG, grain_ssg, instantiate_matrix
+import random
+import time
+
+def main():
+
+  number_bits = 100000
+
+  # Reference stream, one bit at a time
+  t1 = time.time()
+  gen = grain_ssg()
+  reference = 0
+  for _ in range(number_bits):
+    reference = (reference << 1) | next(gen)
+  t2 = time.time()
+  print("grain_ssg time:         " + str(t2-t1))
+
+  # Same stream in reads of random length
+  t1 = time.time()
+  gen = GrainSSG()
+  stream = 0
+  count = 0
+  random.seed(0)
+  while (count < number_bits):
+    length = min(random.randint(0, 1000), number_bits - count)
+    stream = (stream << length) | gen.read(length)
+    count += length
+  t2 = time.time()
+  print("GrainSSG time:          " + str(t2-t1))
+
+  if (stream == reference):
+    print("stream test successful")
+  else:
+    print("stream test failed")
+
+  # First linear layer of picnic-L1
+  with open('picnic-L1.dat', 'r') as matfile:
+    lines = matfile.read().split()
+  expected = [int(line, 2) for line in lines[3:3 + 128]]
+  matrix = instantiate_matrix(128, 128, GrainSSG())
+
+  if (matrix == expected):
+    print("matrix test successful")
+  else:
+    print("matrix test failed")
+
+
+if __name__ == '__main__':
+  main()
@@ -5,19 +5,1034 @@ Date: March 2019
 
 Description:
 Instantiates LowMC in the variants for
-'picnic-L1', 'picnic-L3' and 'picnic-L5'.
+'picnic-L1', 'picnic-L3' and 'picnic-L5'
+with every available backend.
 Tries all testvectors from the Picnic
-reference implementation.
+reference implementation, also from many
+threads sharing one instance. Compares the
+backends, including the views of the MPC
+simulation, on the full sbox layer variants
+'picnic3-L1', 'picnic3-L3' and 'picnic3-L5'
+and checks the known answer of 'picnic3-L1'.
+Calibrates the backends for 'picnic-L1'.
+Checks that small batches are processed block
+by block without a calibration.
+Registers a backend of its own.
+Compares the process pool en- and decryption
+with encrypt_many for every backend.
+Checks that the packaged constants take
+precedence over the working directory.
+Runs the asyncio front-end of aio.py on
+threads and processes, checks its bound
+on the calls submitted to the executor
+and that cancelled calls free their slots.
+Compares encrypt_into and decrypt_into in
+ECB and CBC mode with block by block
+references, in place and into NumPy arrays
+and mmaps.
+Checks the phases recorded by LowMCStats
+for every backend.
+Checks that the inverse file is written,
+reused and recomputed if it does not match.
+Checks that the binary and the text constants
+files load the same constants.
+Checks that the constants cache is shared
+and evicts the least recently used sets.
+Checks the views and output shares of the
+MPC simulation for random key shares and
+tapes against a gate by gate reference.
+Reports the memory footprint of every backend.
+Compares the counter mode and the Merkle tree
+hash of modes.py with block by block references,
+the hash for several batch sizes and worker counts.
 '''
-from lowmc import LowMC
+from aio import AsyncLowMC
+from concurrent.futures import ThreadPoolExecutor
+from lowmc import LowMC, LowMCStats
+from modes import ctr_decrypt, ctr_encrypt, ctr_encrypt_file, merkle_hash
+import asyncio
+import gf2
+import io
+import lowmc as lowmc_module
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import threading
 import time
 
 def main():
 
+  for backend in LowMC.backends:
+    run_testvectors(backend)
+
+  for backend in LowMC.backends:
+    run_threads(backend)
+
+  for param in ['picnic3-L1', 'picnic3-L3', 'picnic3-L5']:
+    run_full_sbox(param)
+
+  run_calibration()
+
+  run_batch_default()
+
+  run_registry()
+
+  for backend in LowMC.backends:
+    run_parallel(backend)
+
+  run_lookup()
+
+  run_async()
+
+  run_into()
+
+  for backend in LowMC.backends:
+    run_stats(backend)
+
+  run_inverse()
+  run_formats()
+  run_cache()
+
+  for param in ['picnic-L1', 'picnic3-L1']:
+    run_mpc(param)
+
+  for backend in LowMC.backends:
+    run_memory(backend)
+
+  run_ctr()
+
+  run_hash()
+
+
+def run_ctr():
+
+  print("==============================")
+  print("Counter mode: picnic-L1")
+  print("==============================")
+
+  lowmc = LowMC('picnic-L1')
+  lowmc.private_key = bytes(range(16))
+
+  failures = 0
   t1 = time.time()
+  for nonce in (b'', bytes(8), bytes(range(14)), bytes(range(15))):
+    for length in (0, 1, 15, 16, 20, 16 * 5 + 3):
+      data = bytes((3 * i) % 256 for i in range(length))
+      keystream = b''.join(
+        lowmc.encrypt(nonce + i.to_bytes(16 - len(nonce), 'big'))
+        for i in range((length + 15) // 16))
+      expected = bytes(d ^ k for d, k in zip(data, keystream))
+      cipher = b''.join(ctr_encrypt(lowmc, [data[:5], data[5:]], nonce, 2))
+      outfile = io.BytesIO()
+      written = ctr_encrypt_file(lowmc, io.BytesIO(data), outfile, nonce, 4)
+      plain = b''.join(ctr_decrypt(lowmc, io.BytesIO(expected), nonce))
+      # A single buffer is one chunk
+      single = [b''.join(ctr_encrypt(lowmc, source, nonce, 2)) for source
+                in (data, bytearray(data), memoryview(data))]
+      if (cipher, outfile.getvalue(), written, plain) \
+         != (expected, expected, length, data) \
+         or (single != [expected] * 3):
+        failures += 1
+
+  # A 15 byte nonce leaves 256 counter blocks, the 257th one fails
+  data = bytes(16 * 256)
+  cipher = b''.join(ctr_encrypt(lowmc, [data], bytes(15), 100))
+  if b''.join(ctr_decrypt(lowmc, [cipher], bytes(15))) != data:
+    failures += 1
+  try:
+    b''.join(ctr_encrypt(lowmc, [data + bytes(1)], bytes(15), 100))
+    failures += 1
+  except AssertionError:
+    pass
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_hash():
+
+  print("==============================")
+  print("Merkle tree hash: picnic-L1")
+  print("==============================")
 
-  # Instantiate LowMC with L1
   lowmc = LowMC('picnic-L1')
+  reference = LowMC('picnic-L1', 'int')
+
+  def compress(chaining, message):
+    reference.private_key = message
+    cipher = reference.encrypt(chaining)
+    return bytes(c ^ h for c, h in zip(cipher, chaining))
+
+  def tree(nodes):
+    if len(nodes) == 1:
+      return nodes[0]
+    split = 1
+    while 2 * split < len(nodes):
+      split *= 2
+    return compress(tree(nodes[:split]), tree(nodes[split:]))
+
+  failures = 0
+  t1 = time.time()
+  for length in (0, 15, 16, 100, 16 * 64, 16 * 131 + 5):
+    data = bytes((7 * i) % 251 for i in range(length))
+    padded = data + bytes([0x80]) + bytes(-(length + 1) % 16)
+    leaves = [compress(bytes(16), padded[i:i + 16])
+              for i in range(0, len(padded), 16)]
+    expected = compress(tree(leaves), (8 * length).to_bytes(16, 'big'))
+    digests = [merkle_hash(lowmc, [data[:7], data[7:]], batch_blocks)
+               for batch_blocks in (1, 8, 64)]
+    digests.append(merkle_hash(lowmc, io.BytesIO(data), 16, workers=2))
+    digests += [merkle_hash(lowmc, source, 8) for source
+                in (data, bytearray(data), memoryview(data))]
+    if digests != [expected] * 7:
+      failures += 1
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_memory(backend):
+
+  print("==============================")
+  print("Memory footprint: " + backend)
+  print("==============================")
+
+  lowmc = LowMC('picnic-L1', backend)
+  lowmc.private_key = bytes(16)
+  lowmc.decrypt(lowmc.encrypt(bytes(16)))
+  footprint = lowmc.memory_footprint()
+  constants = footprint['constants']
+  for name in ('lin_layer', 'lin_layer_inv', 'round_key_mats'):
+    print("{:22s} {}".format(name + ":", constants[name]))
+  for name, size in sorted(constants['tables'].items()):
+    print("{:22s} {}".format(name + ":", size))
+  print("{:22s} {}".format("instance:", footprint['instance']))
+  print("{:22s} {}".format("total:", footprint['total']))
+
+  # The matrices are stored packed, 16 bytes per row of 128 bits. The
+  # unpacked key rows of the integer backends are kept for the next key,
+  # m4rm builds no tables for the key setup.
+  packed = 20 * 128 * 16
+  if (packed <= constants['lin_layer'] < packed + 1024) \
+     and (packed <= constants['lin_layer_inv'] < packed + 1024) \
+     and ((backend not in ('int', 'm4rm'))
+          or ('rows_key' in constants['tables'])) \
+     and ('m4rm_key' not in constants['tables']) \
+     and (footprint['total'] > footprint['instance']):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_calibration():
+
+  print("==============================")
+  print("Calibration: picnic-L1")
+  print("==============================")
+
+  # Into a temporary calibration file, every backend has to pass the
+  # known answer test first
+  calibration_file = lowmc_module.CALIBRATION_FILE
+  with tempfile.TemporaryDirectory() as directory:
+    lowmc_module.CALIBRATION_FILE = os.path.join(directory, 'calibration.json')
+    try:
+      t1 = time.time()
+      result = LowMC.calibrate(['picnic-L1'], batch_sizes=(1, 16, 256),
+                               repeat=1)['picnic-L1']
+      t2 = time.time()
+      print("Processing time: " + str(t2-t1))
+      print("fastest backend: " + result['backend'])
+      print("batch path from: " + str(result['sliced_min_blocks']))
+
+      # Without a backend argument the fastest one is used
+      lowmc = LowMC('picnic-L1')
+      backend = lowmc.backend
+      lowmc.private_key = bytes([0x80] + [0x00] * 15)
+      cipher = lowmc.encrypt_many([bytes([0xAB, 0xFF] + [0x00] * 14)] * 20)
+      explicit = LowMC('picnic-L1', 'bitvector').backend
+    finally:
+      lowmc_module.CALIBRATION_FILE = calibration_file
+
+  expected = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  if (backend == result['backend']) and (explicit == 'bitvector') \
+     and (cipher == [expected] * 20):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_batch_default():
+
+  print("==============================")
+  print("Uncalibrated batches: picnic-L1")
+  print("==============================")
+
+  # The integer backend counting the blocks it encrypts one by one,
+  # blocks of the NumPy batch path are not counted
+  class CountingBackend(lowmc_module.IntBackend):
+    __slots__ = []
+    description = 'integers, counting the encrypted blocks'
+    blocks = 0
+
+    def encrypt(self, round_keys, state):
+      CountingBackend.blocks += 1
+      return lowmc_module.IntBackend.encrypt(self, round_keys, state)
+
+  key = bytes([0x80] + [0x00] * 15)
+  plain = bytes([0xAB, 0xFF] + [0x00] * 14)
+  expected = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  small = CountingBackend.sliced_min_blocks - 1
+  large = CountingBackend.sliced_min_blocks
+  calibration_file = lowmc_module.CALIBRATION_FILE
+  lowmc_module.register_backend('counting', CountingBackend)
+  with tempfile.TemporaryDirectory() as directory:
+    lowmc_module.CALIBRATION_FILE = os.path.join(directory, 'calibration.json')
+    try:
+      lowmc = LowMC('picnic-L1', 'counting')
+      lowmc.private_key = key
+      # Below the default of the backend block by block, from it on with
+      # the batch path (if NumPy is installed)
+      ciphers = [lowmc.encrypt_many([plain]), lowmc.encrypt_many_keys(
+        [key] * small, plain)]
+      dst = bytearray(16)
+      lowmc.encrypt_into(plain, dst)
+      small_blocks = CountingBackend.blocks
+      ciphers += [lowmc.encrypt_many([plain] * large),
+                  lowmc.encrypt_many_keys([key] * large, plain)]
+      large_blocks = CountingBackend.blocks - small_blocks
+    finally:
+      lowmc_module.CALIBRATION_FILE = calibration_file
+      del lowmc_module.BACKENDS['counting']
+      LowMC.backends = tuple(lowmc_module.BACKENDS)
+
+  sliced = lowmc_module._import_numpy() is not None
+  if (ciphers == [[expected], [expected] * small, [expected] * large,
+                  [expected] * large]) and (bytes(dst) == expected) \
+     and (small_blocks == small + 2) \
+     and (large_blocks == (0 if sliced else 2 * large)):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_registry():
+
+  print("==============================")
+  print("Backend registry: picnic-L1")
+  print("==============================")
+
+  # The integer backend counting the blocks it encrypts
+  class CountingBackend(lowmc_module.IntBackend):
+    __slots__ = []
+    description = 'integers, counting the encrypted blocks'
+    blocks = 0
+
+    def encrypt(self, round_keys, state):
+      CountingBackend.blocks += 1
+      return lowmc_module.IntBackend.encrypt(self, round_keys, state)
+
+  lowmc_module.register_backend('counting', CountingBackend)
+  try:
+    listed = 'counting' in LowMC.backends
+    lowmc = LowMC('picnic-L1', 'counting')
+    lowmc.private_key = bytes([0x80] + [0x00] * 15)
+    cipher = lowmc.encrypt(bytes([0xAB, 0xFF] + [0x00] * 14))
+    plain = lowmc.decrypt(cipher)
+  finally:
+    del lowmc_module.BACKENDS['counting']
+    LowMC.backends = tuple(lowmc_module.BACKENDS)
+
+  expected = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  if listed and (cipher == expected) and (CountingBackend.blocks == 1) \
+     and (plain == bytes([0xAB, 0xFF] + [0x00] * 14)) \
+     and ('counting' not in LowMC.backends):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_parallel(backend):
+
+  print("==============================")
+  print("Process pool: " + backend)
+  print("==============================")
+
+  lowmc = LowMC('picnic-L1', backend)
+  lowmc.private_key = bytes(range(16))
+  # Few blocks for the slow bitvector backend, not a multiple of the
+  # chunk sizes
+  number = 4 if (backend == 'bitvector') else 101
+  data = os.urandom(number * 16)
+  expected = lowmc.encrypt_many(data)
+
+  failures = 0
+  t1 = time.time()
+  for chunk_blocks in (3, 7, number + 5):
+    cipher = lowmc.encrypt_parallel(bytearray(data), workers=2,
+                                    chunk_blocks=chunk_blocks)
+    plain = lowmc.decrypt_parallel(cipher, workers=2,
+                                   chunk_blocks=chunk_blocks)
+    if (cipher != expected) or (plain != data):
+      failures += 1
+  if (lowmc.encrypt_parallel(b'', workers=2) != b'') \
+     or (lowmc.decrypt_parallel(b'', workers=2) != b''):
+    failures += 1
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_lookup():
+
+  print("==============================")
+  print("Constants lookup: picnic-L1")
+  print("==============================")
+
+  # A stray constants file in the working directory is ignored for a
+  # packaged parameter set, the inverse file goes next to the package
+  cwd = os.getcwd()
+  package = os.path.dirname(os.path.abspath(lowmc_module.__file__))
+  with tempfile.TemporaryDirectory() as directory:
+    with open(os.path.join(directory, 'picnic-L1.dat'), 'w') as outfile:
+      outfile.write('not a constants file\n')
+    os.chdir(directory)
+    try:
+      lowmc_module.clear_constants_cache()
+      lowmc = LowMC('picnic-L1')
+      lowmc.private_key = bytes([0x80] + [0x00] * 15)
+      plain = bytes([0xAB, 0xFF] + [0x00] * 14)
+      cipher = lowmc.encrypt(plain)
+      decrypted = lowmc.decrypt(cipher)
+      found = lowmc_module._find_constants('picnic-L1')
+      stray = os.listdir(directory)
+    finally:
+      os.chdir(cwd)
+      lowmc_module.clear_constants_cache()
+
+  expected = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  if (cipher == expected) and (decrypted == plain) \
+     and (os.path.dirname(found) == package) \
+     and (stray == ['picnic-L1.dat']):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+class GatedExecutor(ThreadPoolExecutor):
+  # Counts the calls submitted and not finished yet, the calls wait for
+  # the gate to open before they start
+  def __init__(self, max_workers):
+    ThreadPoolExecutor.__init__(self, max_workers)
+    self.gate = threading.Event()
+    self.lock = threading.Lock()
+    self.pending = 0
+    self.max_pending = 0
+    self.started = 0
+
+  def submit(self, function, *args):
+    with self.lock:
+      self.pending += 1
+      self.max_pending = max(self.max_pending, self.pending)
+
+    def call():
+      self.gate.wait()
+      with self.lock:
+        self.started += 1
+      return function(*args)
+
+    future = ThreadPoolExecutor.submit(self, call)
+    future.add_done_callback(self.finished)
+    return future
+
+  def finished(self, future):
+    with self.lock:
+      self.pending -= 1
+
+
+def run_async():
+
+  print("==============================")
+  print("asyncio front-end: picnic-L1")
+  print("==============================")
+
+  lowmc = LowMC('picnic-L1')
+  lowmc.private_key = bytes(range(16))
+  data = os.urandom(40 * 16)
+  expected = lowmc.encrypt_many(data)
+  blocks = [data[i:i + 16] for i in range(0, len(data), 16)]
+  expected_blocks = [expected[i:i + 16] for i in range(0, len(data), 16)]
+
+  async def check():
+    failures = 0
+
+    # Chunks of 3 blocks on threads and of 7 blocks on processes
+    for mode, chunk_blocks in (('thread', 3), ('process', 7)):
+      async with AsyncLowMC(lowmc, mode, 2, chunk_blocks) as aio:
+        if (await aio.encrypt_many(data) != expected) \
+           or (await aio.decrypt_many(expected_blocks) != blocks) \
+           or (await aio.encrypt_many(blocks) != expected_blocks) \
+           or (await aio.encrypt(data[:16]) != expected[:16]) \
+           or (await aio.decrypt(expected[:16]) != data[:16]):
+          failures += 1
+
+    # With one worker and two slots, one chunk runs and one is queued,
+    # the other chunks are not even submitted yet
+    executor = GatedExecutor(1)
+    aio = AsyncLowMC(lowmc, executor, 2, 1)
+    executor.gate.set()
+    if (await aio.encrypt_many(data) != expected) \
+       or (executor.max_pending != 2) or (aio.running != 0):
+      failures += 1
+
+    # No task per chunk, only this one and the call are running.
+    # Cancelling the call cancels the queued chunk, the running one
+    # keeps its slot until it has finished.
+    executor.gate.clear()
+    executor.started = 0
+    task = asyncio.ensure_future(aio.encrypt_many(data))
+    while (aio.running < 2):
+      await asyncio.sleep(0.01)
+    tasks = len(asyncio.all_tasks())
+    task.cancel()
+    try:
+      await task
+      failures += 1
+    except asyncio.CancelledError:
+      pass
+    await asyncio.sleep(0.01)
+    running = aio.running
+    executor.gate.set()
+    while (aio.running > 0):
+      await asyncio.sleep(0.01)
+    if (tasks != 2) or (running != 1) or (executor.started != 1) \
+       or (await aio.encrypt(data[:16]) != expected[:16]) \
+       or (aio.running != 0):
+      failures += 1
+    executor.shutdown()
+    return failures
+
+  t1 = time.time()
+  failures = asyncio.run(check())
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_into():
+
+  print("==============================")
+  print("Preallocated buffers: picnic-L1")
+  print("==============================")
+
+  lowmc = LowMC('picnic-L1', 'int')
+  lowmc.private_key = bytes(range(16))
+  data = os.urandom(40 * 16)
+  iv = os.urandom(16)
+  blocks = [data[i:i + 16] for i in range(0, len(data), 16)]
+
+  def xor(a, b):
+    return bytes(x ^ y for x, y in zip(a, b))
+
+  # Block by block references
+  ecb = b''.join(lowmc.encrypt(block) for block in blocks)
+  cbc = []
+  chain = iv
+  for block in blocks:
+    chain = lowmc.encrypt(xor(block, chain))
+    cbc.append(chain)
+  cbc = b''.join(cbc)
+
+  failures = 0
+  t1 = time.time()
+
+  # ECB and CBC into a new buffer, CBC continued with the last block
+  dst = bytearray(len(data))
+  lowmc.encrypt_into(data, dst)
+  plain = bytearray(len(data))
+  lowmc.decrypt_into(dst, plain)
+  if (dst != ecb) or (plain != data):
+    failures += 1
+  lowmc.encrypt_into(data, dst, 'cbc', iv)
+  lowmc.decrypt_into(cbc, plain, 'cbc', iv)
+  if (dst != cbc) or (plain != data):
+    failures += 1
+  half = len(data) // 2
+  first = bytearray(half)
+  second = bytearray(len(data) - half)
+  lowmc.encrypt_into(data[:half], first, 'cbc', iv)
+  lowmc.encrypt_into(data[half:], second, 'cbc', first[-16:])
+  if (first + second != cbc):
+    failures += 1
+
+  # In place, also through a memoryview
+  buf = bytearray(data)
+  lowmc.encrypt_into(buf, buf)
+  if (buf != ecb):
+    failures += 1
+  lowmc.decrypt_into(buf, memoryview(buf))
+  if (buf != data):
+    failures += 1
+  buf = bytearray(cbc)
+  lowmc.decrypt_into(buf, buf, 'cbc', iv)
+  if (buf != data):
+    failures += 1
+
+  # Into a NumPy array and an anonymous mmap
+  try:
+    import numpy
+    array = numpy.zeros(len(data), dtype=numpy.uint8)
+    lowmc.encrypt_into(data, array)
+    if (array.tobytes() != ecb):
+      failures += 1
+  except ImportError:
+    pass
+  with mmap.mmap(-1, len(data)) as mapped:
+    lowmc.encrypt_into(data, mapped, 'cbc', iv)
+    if (mapped[:] != cbc):
+      failures += 1
+
+  # Read-only destinations and length mismatches are rejected
+  for dst in (bytes(len(data)), memoryview(bytearray(len(data))).toreadonly(),
+              bytearray(len(data) - 16), bytearray(len(data) + 16)):
+    try:
+      lowmc.encrypt_into(data, dst)
+      failures += 1
+    except AssertionError:
+      pass
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_stats(backend):
+
+  print("==============================")
+  print("Statistics: " + backend)
+  print("==============================")
+
+  key = bytes(range(16))
+  reference = LowMC('picnic-L1', backend)
+  reference.private_key = key
+  # Without a calibration, the batch path is used from the default batch
+  # size of the backend on
+  calibration_file = lowmc_module.CALIBRATION_FILE
+  lowmc_module.CALIBRATION_FILE = os.path.join(tempfile.gettempdir(),
+                                               'no-such-calibration.json')
+  try:
+    stats = LowMCStats()
+    lowmc = LowMC('picnic-L1', backend, stats)
+  finally:
+    lowmc_module.CALIBRATION_FILE = calibration_file
+  lowmc.private_key = key
+  blocks = [bytes([i] * 16) for i in range(3)]
+
+  failures = 0
+  t1 = time.time()
+
+  # Block by block, every phase once per round and block. The round
+  # constants of hoisted are part of its round keys.
+  ciphers = [lowmc.encrypt(block) for block in blocks]
+  snapshot = stats.snapshot()
+  calls = {phase: snapshot[phase]['calls'] for phase in LowMCStats.phases}
+  constant_additions = 0 if (backend == 'hoisted') else 3 * 20
+  if (ciphers != [reference.encrypt(block) for block in blocks]) \
+     or (calls['load_constants'] != 1) or (calls['encrypt'] != 3) \
+     or (calls['sbox'] != 3 * 20) or (calls['linear_layer'] != 3 * 20) \
+     or (calls['key_addition'] != 3 * 21) \
+     or (calls['constant_addition'] != constant_additions) \
+     or (calls['decrypt'] != 0) or (snapshot['encrypt']['seconds'] <= 0):
+    failures += 1
+
+  # The snapshot is a copy, reset sets all counters to zero
+  snapshot['encrypt']['calls'] = 100
+  if (stats.snapshot()['encrypt']['calls'] != 3):
+    failures += 1
+  stats.reset()
+  if any(value != {'calls': 0, 'seconds': 0.0}
+         for value in stats.snapshot().values()):
+    failures += 1
+
+  # A batch of blocks, the batch path calls a phase once per round
+  number = lowmc_module.BACKENDS[backend].sliced_min_blocks
+  blocks = [bytes([i] * 16) for i in range(number)]
+  if (lowmc.decrypt_many([reference.encrypt(block) for block in blocks])
+      != blocks):
+    failures += 1
+  calls = {phase: value['calls']
+           for phase, value in stats.snapshot().items()}
+  rounds = 20 if ((backend != 'bitvector')
+                  and (lowmc_module._import_numpy() is not None)) \
+      else number * 20
+  if (calls['decrypt'] != number) or (calls['sbox'] != rounds) \
+     or (calls['encrypt'] != 0):
+    failures += 1
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_inverse():
+
+  print("==============================")
+  print("Inverse file: picnic-L1")
+  print("==============================")
+
+  path = lowmc_module._find_constants('picnic-L1') + '.inv'
+  key = bytes(range(16))
+  plain = bytes(16)
+
+  def decrypt_fresh():
+    # Decryption with cold constants, returns the recorded calls
+    lowmc_module.clear_constants_cache()
+    stats = LowMCStats()
+    lowmc = LowMC('picnic-L1', 'int', stats)
+    lowmc.private_key = key
+    valid = (lowmc.decrypt(lowmc.encrypt(plain)) == plain)
+    snapshot = stats.snapshot()
+    return (valid, snapshot['load_inverse']['calls'],
+            snapshot['inversion']['calls'])
+
+  def corrupt(offset):
+    with open(path, 'r+b') as invfile:
+      invfile.seek(offset)
+      byte = invfile.read(1)
+      invfile.seek(offset)
+      invfile.write(bytes([byte[0] ^ 0x01]))
+
+  failures = 0
+  t1 = time.time()
+  if os.path.exists(path):
+    os.remove(path)
+
+  # An object that only encrypts never inverts, whatever the backend
+  for backend in LowMC.backends:
+    lowmc_module.clear_constants_cache()
+    stats = LowMCStats()
+    lowmc = LowMC('picnic-L1', backend, stats)
+    lowmc.private_key = key
+    lowmc.encrypt_many([plain] * 3)
+    lowmc.encrypt(plain)
+    snapshot = stats.snapshot()
+    if (snapshot['load_inverse']['calls'] != 0) \
+       or (snapshot['inversion']['calls'] != 0) \
+       or (lowmc.memory_footprint()['constants']['lin_layer_inv'] != 0) \
+       or os.path.exists(path):
+      failures += 1
+
+  # Computed and written on the first decryption, read back afterwards
+  if (decrypt_fresh() != (True, 1, 1)) or (not os.path.exists(path)):
+    failures += 1
+  if (decrypt_fresh() != (True, 1, 0)):
+    failures += 1
+
+  # Recomputed (and rewritten) for a wrong digest of the constants in the
+  # header or a payload that does not match its digest
+  header = lowmc_module.INVERSE_HEADER.size
+  for offset in (header - 64, header + 5):
+    corrupt(offset)
+    if (decrypt_fresh() != (True, 1, 1)) or (decrypt_fresh() != (True, 1, 0)):
+      failures += 1
+
+  lowmc_module.clear_constants_cache()
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_formats():
+
+  print("==============================")
+  print("Constants formats: picnic-L1")
+  print("==============================")
+
+  # A custom parameter set without packaged files is read from the text
+  # file in the working directory, here a copy of the picnic-L1 constants
+  cwd = os.getcwd()
+  package = os.path.dirname(os.path.abspath(lowmc_module.__file__))
+  key = bytes([0x80] + [0x00] * 15)
+  plain = bytes([0xAB, 0xFF] + [0x00] * 14)
+  with tempfile.TemporaryDirectory() as directory:
+    shutil.copy(os.path.join(package, 'picnic-L1.dat'),
+                os.path.join(directory, 'lowmc-128-128-10-20.dat'))
+    os.chdir(directory)
+    try:
+      lowmc_module.clear_constants_cache()
+      ciphers = []
+      for param in ('picnic-L1', (128, 128, 10, 20)):
+        lowmc = LowMC(param)
+        lowmc.private_key = key
+        ciphers.append(lowmc.encrypt(plain))
+      binary = lowmc_module._constants_cache['picnic-L1']
+      text = lowmc_module._constants_cache['lowmc-128-128-10-20']
+    finally:
+      os.chdir(cwd)
+      lowmc_module.clear_constants_cache()
+
+  # The matrices of the binary file are read from the mapping
+  expected = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  if (ciphers == [expected, expected]) \
+     and isinstance(binary.lin_layer.data.obj, mmap.mmap) \
+     and isinstance(binary.round_key_mats.data.obj, mmap.mmap) \
+     and (bytes(binary.lin_layer.data) == bytes(text.lin_layer.data)) \
+     and (binary.round_consts == text.round_consts) \
+     and (bytes(binary.round_key_mats.data)
+          == bytes(text.round_key_mats.data)):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_cache():
+
+  print("==============================")
+  print("Constants cache")
+  print("==============================")
+
+  cache = lowmc_module._constants_cache
+
+  def load(param):
+    lowmc = LowMC(param)
+    lowmc.private_key = bytes(lowmc.keysize_bytes)
+    return lowmc.encrypt(bytes(lowmc.blocksize_bytes))
+
+  failures = 0
+  try:
+    # The objects of a parameter set share one entry, whatever the backend
+    lowmc_module.clear_constants_cache()
+    lowmc_int = LowMC('picnic-L1', 'int')
+    lowmc_m4rm = LowMC('picnic-L1', 'm4rm')
+    for lowmc in (lowmc_int, lowmc_m4rm):
+      lowmc.private_key = bytes(16)
+    cipher = lowmc_int.encrypt(bytes(16))
+    if (lowmc_m4rm.encrypt(bytes(16)) != cipher) \
+       or (list(cache) != ['picnic-L1']) \
+       or ('rows' not in lowmc_m4rm.table_sizes()) \
+       or ('m4rm' not in lowmc_int.table_sizes()):
+      failures += 1
+
+    # Clearing the cache leaves the existing objects working
+    lowmc_module.clear_constants_cache()
+    if (len(cache) != 0) or (lowmc_int.encrypt(bytes(16)) != cipher) \
+       or (lowmc_m4rm.decrypt(cipher) != bytes(16)):
+      failures += 1
+
+    # Least recently used sets are evicted first
+    lowmc_module.set_constants_cache_size(2)
+    load('picnic-L1')
+    load('picnic-L3')
+    load('picnic-L1')
+    load('picnic-L5')
+    if (list(cache) != ['picnic-L1', 'picnic-L5']):
+      failures += 1
+    lowmc_module.set_constants_cache_size(1)
+    if (list(cache) != ['picnic-L5']):
+      failures += 1
+  finally:
+    lowmc_module.set_constants_cache_size(None)
+    lowmc_module.clear_constants_cache()
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_mpc(param):
+
+  print("==============================")
+  print("MPC simulation: " + param)
+  print("==============================")
+
+  # Random keys, shares and tapes for a few repetitions. The XOR of the
+  # three views of a repetition is the sequence of its AND gate outputs,
+  # the random bits cancel out. They are compared with the gates of a
+  # plain encryption, evaluated round by round with the sbox table of the
+  # original implementation, and the XOR of the output shares with the
+  # ciphertext.
+  number = 3
+  failures = 0
+  t1 = time.time()
+  for backend in LowMC.backends:
+    lowmc = LowMC(param, backend)
+    key_size, size = lowmc.keysize_bytes, lowmc.blocksize_bytes
+    keys = [os.urandom(key_size) for _ in range(number)]
+    plains = [os.urandom(size) for _ in range(number)]
+    share_0 = [os.urandom(key_size) for _ in range(number)]
+    share_1 = [os.urandom(key_size) for _ in range(number)]
+    share_2 = [bytes(k ^ s ^ t for k, s, t in zip(*shares))
+               for shares in zip(keys, share_0, share_1)]
+    tapes = [[os.urandom(lowmc.tape_bytes) for _ in range(number)]
+             for _ in range(3)]
+    views, outputs = lowmc.simulate_mpc([share_0, share_1, share_2],
+                                        plains, tapes)
+    for r in range(number):
+      lowmc.private_key = keys[r]
+      gates, cipher = mpc_reference(param, keys[r], plains[r])
+      view = int.from_bytes(bytes(a ^ b ^ c for a, b, c in zip(
+        views[0][r], views[1][r], views[2][r])), 'big')
+      view >>= 8 * lowmc.tape_bytes - len(gates)
+      output = bytes(a ^ b ^ c for a, b, c in zip(
+        outputs[0][r], outputs[1][r], outputs[2][r]))
+      if (view != int(''.join(str(gate) for gate in gates), 2)) \
+         or (cipher != output) or (lowmc.encrypt(plains[r]) != cipher):
+        failures += 1
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def mpc_reference(param, key, plain):
+  # AND gate outputs (a*b, b*c, c*a per sbox, round by round) and the
+  # ciphertext of a plain encryption, on the constants of the parameter
+  # set. Like in the original implementation, the first sbox takes the
+  # state bits 0 to 2 (most significant first) as c, b, a.
+  name, n, keysize, sboxes, rounds = lowmc_module.parameter_set(param)
+  constants = lowmc_module._constants_cache[name]
+  sbox = [0x00, 0x01, 0x03, 0x06, 0x07, 0x04, 0x05, 0x02]
+  size = (n + 7) // 8
+  key = int.from_bytes(key, 'big') >> (8 * ((keysize + 7) // 8) - keysize)
+  state = int.from_bytes(plain, 'big') >> (8 * size - n)
+  state ^= gf2.multiply_vec(constants.round_key_mats[0], key)
+  gates = []
+  for i in range(rounds):
+    bits = [(state >> (n - 1 - j)) & 1 for j in range(n)]
+    for k in range(sboxes):
+      c, b, a = bits[3 * k:3 * k + 3]
+      gates += [a & b, b & c, c & a]
+      value = sbox[(a << 2) | (b << 1) | c]
+      bits[3 * k:3 * k + 3] = [value & 1, (value >> 1) & 1, value >> 2]
+    state = int(''.join(str(bit) for bit in bits), 2)
+    state = gf2.multiply_vec(constants.lin_layer[i], state) \
+        ^ constants.round_consts[i] \
+        ^ gf2.multiply_vec(constants.round_key_mats[i + 1], key)
+  return gates, (state << (8 * size - n)).to_bytes(size, 'big')
+
+
+def run_full_sbox(param):
+
+  # The backends are compared to each other and to the known answer of
+  # the parameter set, if there is one (see lowmc.KNOWN_ANSWERS)
+  print("==============================")
+  print("Full sbox layer: " + param)
+  print("==============================")
+
+  known = lowmc_module.KNOWN_ANSWERS.get(param)
+  reference = None
+  for backend in LowMC.backends:
+    lowmc = LowMC(param, backend)
+    known_valid = True
+    if known is not None:
+      known_key, known_plain, known_cipher = (bytes.fromhex(value)
+                                              for value in known)
+      lowmc.private_key = known_key
+      known_valid = (lowmc.encrypt(known_plain) == known_cipher) \
+          and (lowmc.decrypt(known_cipher) == known_plain)
+    key = bytes(range(lowmc.keysize_bytes))
+    lowmc.private_key = key
+    padding = 8 * lowmc.blocksize_bytes - lowmc.blocksize
+    plain = bytes([0xAB] * (lowmc.blocksize_bytes - 1)
+                  + [(0xFF << padding) & 0xFF])
+    cipher = lowmc.encrypt(plain)
+    # The views of the MPC simulation are compared as well
+    mask = bytes([0xA5] * len(key))
+    shares = [[bytes(k ^ m for k, m in zip(key, mask))], [mask],
+              [bytes(len(key))]]
+    tapes = [bytes([0x0F * (p + 1)] * lowmc.tape_bytes) for p in range(3)]
+    views, outputs = lowmc.simulate_mpc(shares, plain, tapes)
+    cipher_mpc = bytes(a ^ b ^ c for a, b, c in
+                       zip(outputs[0][0], outputs[1][0], outputs[2][0]))
+    if reference is None:
+      reference = (cipher, views)
+    print(backend + ": " + cipher.hex().upper())
+    if ((cipher, views) == reference) and (cipher_mpc == cipher) \
+       and (lowmc.decrypt(cipher) == plain) and known_valid:
+      print("test successful")
+    else:
+      print("test failed")
+
+
+def run_threads(backend):
+
+  print("==============================")
+  print("Threads: " + backend)
+  print("==============================")
+
+  # One instance shared by all threads, switching threads as often as
+  # possible to provoke any state shared between en- and decryptions
+  lowmc = LowMC('picnic-L1', backend)
+  lowmc.private_key = bytes([0x80] + [0x00] * 15)
+  plain = bytes([0xAB, 0xFF] + [0x00] * 14)
+  cipher = bytes.fromhex("0E30720B9F64D5C2A7771C8C238D8F70")
+  rounds = 1 if (backend == 'bitvector') else 50
+
+  def work(_):
+    failures = 0
+    for _ in range(rounds):
+      if (lowmc.encrypt(plain) != cipher) or (lowmc.decrypt(cipher) != plain):
+        failures += 1
+    return failures
+
+  t1 = time.time()
+  interval = sys.getswitchinterval()
+  sys.setswitchinterval(1e-5)
+  try:
+    with ThreadPoolExecutor(16) as executor:
+      failures = sum(executor.map(work, range(32)))
+  finally:
+    sys.setswitchinterval(interval)
+  t2 = time.time()
+  print("Processing time: " + str(t2-t1))
+
+  if (failures == 0):
+    print("test successful")
+  else:
+    print("test failed")
+
+
+def run_testvectors(backend):
+
+  print("==============================")
+  print("Backend: " + backend)
+  print("==============================")
+
+  t1 = time.time()
+
+  # Instantiate LowMC with L1
+  lowmc = LowMC('picnic-L1', backend)
 
   # Vectorset 1 for Picnic-L1
   key    = bytes([ 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, \
@@ -52,7 +1067,7 @@ def main():
   testing(lowmc, "Picnic-L1: Vectorset 3", key, plain, cipher)
 
   # Instantiate LowMC with L3
-  lowmc = LowMC('picnic-L3')
+  lowmc = LowMC('picnic-L3', backend)
 
   # Vectorset 1 for Picnic-L3
   key    = bytes([ 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, \
@@ -94,7 +1109,7 @@ def main():
   testing(lowmc, "Picnic-L3: Vectorset 3", key, plain, cipher)
 
   # Instantiate LowMC with L5
-  lowmc = LowMC('picnic-L5')
+  lowmc = LowMC('picnic-L5', backend)
 
   # Vectorset 1 for Picnic-L5
   key    = bytes([ 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, \
@@ -153,16 +1168,37 @@ def testing(lowmc, vectorset, key, plain, cipher):
   print("------------------------------")
   print(vectorset)
   print("------------------------------")
+  t1 = time.time()
   lowmc.private_key = key
+  t2 = time.time()
+  print("key setup time:        " + str(t2-t1))
   print("start encryption")
   cipher_new = lowmc.encrypt(plain)
   print("start decryption")
   plain_new = lowmc.decrypt(cipher)
+  print("start batch encryption and decryption")
+  cipher_many = lowmc.encrypt_many([plain, plain])
+  plain_many = lowmc.decrypt_many(cipher + cipher)
+  print("start key batch encryption")
+  cipher_keys = lowmc.encrypt_many_keys([key, key], plain)
+  print("start mpc simulation")
+  share_0 = bytes([0x5A] * len(key))
+  share_1 = bytes(range(len(key)))
+  share_2 = bytes(k ^ s ^ t for k, s, t in zip(key, share_0, share_1))
+  tapes = [bytes([t] * lowmc.tape_bytes) * 2 for t in (0x0F, 0x3C, 0xA5)]
+  views, outputs = lowmc.simulate_mpc(
+    [[share_0, share_0], [share_1, share_1], [share_2, share_2]],
+    plain, tapes)
+  cipher_mpc = [bytes(a ^ b ^ c for a, b, c in zip(*shares))
+                for shares in zip(*outputs)]
   print("plaintext:             " + plain.hex().upper())
   print("calculated ciphertext: " + cipher_new.hex().upper())
   print("expected   ciphertext: " + cipher.hex().upper())
   print("calculated plaintext:  " + plain_new.hex().upper())
-  if (cipher_new == cipher) and (plain_new == plain):
+  if (cipher_new == cipher) and (plain_new == plain) \
+     and (cipher_many == [cipher, cipher]) and (plain_many == plain + plain) \
+     and (cipher_keys == [cipher, cipher]) \
+     and (cipher_mpc == [cipher, cipher]):
     print("test successful")
   else:
     print("test failed")